@@ -1,8 +1,10 @@
+import os
 import numpy as np
 from PyQt5.QtWidgets import QWidget
 from Frontend.src.ui.tp4 import Ui_Form
 from Frontend.src.tp4_stages import Stages
 from back.backend import FilterSpace, FilterType, ApproxType, plot_template
+from back.design_cache import DesignCache
 
 class MainWindowQ (QWidget, Ui_Form):
 
@@ -13,7 +15,7 @@ class MainWindowQ (QWidget, Ui_Form):
         self.setupUi(self)
         self.error = 0
         self.cant_curvas = 0
-        self.fs = FilterSpace()
+        self.fs = FilterSpace(workers=os.cpu_count() or 1, design_cache=DesignCache())
 
         self.Qmax = 0
         self.Nmaxmin = 0
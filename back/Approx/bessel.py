@@ -1,7 +1,30 @@
 import numpy as np
 import scipy.signal as ss
+from math import factorial
+from back.response import zpk_response
 from back.FilterClass import Filter, ApproxType, FilterType
 
+# Tabla de coeficientes ya calculados por orden (ver get_bessel_coefs)
+bessel_table = {}
+
+# get_bessel_coefs: Coeficientes (potencias descendentes de s) del polinomio de Bessel inverso de orden n,
+# el denominador de ss.bessel(n, 1, norm='delay'): a_k = (2n - k)! / (2^(n - k) k! (n - k)!), y los de su derivada
+def get_bessel_coefs(n):
+    if n not in bessel_table:
+        coefs = np.array([factorial(2*n - k) / (2**(n - k) * factorial(k) * factorial(n - k)) for k in range(n, -1, -1)])
+        dcoefs = coefs[:-1] * np.arange(n, 0, -1)
+        coefs.setflags(write=False)
+        dcoefs.setflags(write=False)
+        bessel_table[n] = coefs, dcoefs
+    return bessel_table[n]
+
+# bessel_delay: Retardo de grupo del prototipo de Bessel de orden n normalizado en retardo (1 en continua) en las
+# frecuencias w, sin calcular los polos: con H = 1/D, el retardo es Re(D'(jw) / D(jw))
+def bessel_delay(n, w):
+    coefs, dcoefs = get_bessel_coefs(n)
+    powers = (1j * np.asarray(w, dtype=float))[:, np.newaxis] ** np.arange(n, -1, -1)
+    return np.real((powers[:, 1:] @ dcoefs) / (powers @ coefs))
+
 
 class Bessel(Filter):
     def __init__(self, filter_type, filter_data, n, Q, nmin, nmax, Qmax, GD, tol):
@@ -11,35 +34,49 @@ class Bessel(Filter):
         if self.type == FilterType.GD:
             wpn = self.get_wan()
             if self.data.tol is None: self.data.tol = 0.1
-            n = nmin
-            for i in range(nmax - nmin):
-                [z, p, g] = ss.bessel(n, 1, analog=True, output="zpk", norm='delay')
-                # num, den = ss.zpk2tf(z, p, g)
-                # if num[-1] != 0:
-                #     k = den[-1] / num[-1]
-                # else:
-                #     k = 1
-                # g = k * g
-                '''w, mod, ph = ss.bode([b, a])
-                group_delay = np.divide(-np.diff(ph), np.diff(w))  # d(ph)/d(w)'''
-                w = np.linspace(wpn/10, wpn*10, num=1000)
-                w, gd = self.get_GD(w, z=z, p=p, k=g)
-                closest = (np.abs(w - wpn)).argmin()
-                if gd[closest] >= (1 - self.data.tol)*self.data.GD:
-                    break
-                n = n + 1
+
+            # Sólo hacen falta el retardo en wpn y en wpn/10 (la referencia)
+            def check(n):
+                gd = bessel_delay(n, [wpn/10, wpn])
+                return gd[1] >= (1 - self.data.tol)*gd[0]
         else:
-            n = nmin
-            for i in range(nmax - nmin):
-                z, p, k = self.get_fun(n)
+            def check(n):
+                z, p, k = self.get_prototype(n)
                 #k = k * self.fix_gain(ss.zpk2tf(z, p, k), FilterType.LP)
                 wap = np.linspace(min(1, self.get_wan()), max(1, self.get_wan()), 2)
-                wap, mod, ph = ss.bode([z, p, k], w=wap)
+                wap, mod, ph, gd = zpk_response(z, p, k, wap)
+                return np.around(mod[0]) >= -self.data.Ap and np.around(mod[1]) <= -self.data.Aa
+            return self.search_n(check, nmin, nmax, self.get_first_n(nmin, nmax))
+        return self.search_n(check, nmin, nmax)
+
+    # get_first_n: Primer orden entre nmin y nmax - 1 que cumple la plantilla (nmax si ninguno), que es el n0 que
+    # necesita search_n en get_best_n (fuera del modo retardo de grupo).
+    # Con el prototipo normalizado en retardo y escalado en 1/wan, el módulo en w es |H(jw)| = D(0) / |D(jw wan)|, con D
+    # el polinomio de Bessel inverso. Ese chequeo no es monótono en n (un orden puede cumplir y el siguiente no), así que
+    # se recorren los órdenes desde nmin hasta el primero que cumple, como la búsqueda lineal original.
+    def get_first_n(self, nmin, nmax):
+        wan = self.get_wan()
+        w = np.array([min(1, wan), max(1, wan)]) * wan
+        with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+            for n in range(nmin, nmax):
+                coefs = get_bessel_coefs(n)[0]
+                mod = 20 * np.log10(coefs[-1] / np.abs(np.polyval(coefs, 1j * w)))
                 if np.around(mod[0]) >= -self.data.Ap and np.around(mod[1]) <= -self.data.Aa:
-                    break
-                n = n + 1
-        return n
+                    return n
+        return nmax
+
+
+    # En la biblioteca está el prototipo normalizado en retardo (el de FilterType.GD)
+    def get_params(self):
+        return 0, 0
+
+    def scale_prototype(self, z, p, k):
+        if self.type == FilterType.GD:
+            return z, p, k
+        return ss.lp2lp_zpk(z, p, k, 1 / self.get_wan())
 
+    def get_normalized_fun(self, n):
+        return ss.bessel(n, 1, 'lowpass', analog=True, output='zpk', norm='delay')
 
     def get_fun(self, n):
         #z, p, k = ss.bessel(n, self.data.wp*self.data.GD, 'lowpass', analog=True, output='zpk', norm='delay')
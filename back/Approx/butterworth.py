@@ -10,6 +10,9 @@ class Butterworth(Filter):
         n, wo = ss.buttord(self.data.wp, self.data.wa, self.data.Ap, self.data.Aa, True)
         return n
 
+    def get_params(self):
+        return self.data.Ap, 0
+
     def get_fun(self, n):
         z, p, k = ss.buttap(n)
         factor = np.power(self.get_eps(self.data.Ap), -1/n)
@@ -10,6 +10,9 @@ class Cauer(Filter):
         n, wo = ss.ellipord(self.data.wp, self.data.wa, self.data.Ap, self.data.Aa, True)
         return n
 
+    def get_params(self):
+        return self.data.Ap, self.data.Aa
+
     def get_fun(self, n):
         z, p, k = ss.ellipap(n, self.data.Ap, self.data.Aa)
         return z, p, k
@@ -10,6 +10,10 @@ class ChebyI(Filter):
         n, wo = ss.cheb1ord(self.data.wp, self.data.wa, self.data.Ap, self.data.Aa, True)
         return n
 
+    def get_params(self):
+        if self.data.rp is None: self.data.rp = self.data.Ap/2
+        return self.data.rp, 0
+
     def get_fun(self, n):
         if self.data.rp is None: self.data.rp = self.data.Ap/2
         z, p, k = ss.cheb1ap(n, self.data.rp)
@@ -10,6 +10,9 @@ class ChebyII(Filter):
         n, wo = ss.cheb2ord(self.data.wp, self.data.wa, self.data.Ap, self.data.Aa, True)
         return n
 
+    def get_params(self):
+        return 0, self.data.Aa
+
     def get_fun(self, n):
         #if self.data.rp is None: self.data.rp = self.data.Ap
         z, p, k = ss.cheb2ap(n, self.data.Aa)
@@ -1,8 +1,30 @@
 import numpy as np
-import scipy.signal as ss
+import numpy.polynomial.polynomial as poly
 from scipy.special import factorial
+from back.response import zpk_response, group_delay
 from back.FilterClass import Filter, ApproxType, FilterType
 
+# Tabla de prototipos ya calculados por orden (ver get_gauss_poles), compartida por todos los filtros de Gauss
+gauss_table = {}
+
+# get_gauss_poles: Polos y ganancia del prototipo de Gauss de orden n, con |H(jw)|^2 = 1 / P(w^2) y
+# P(x) = 1 + x + x^2/2! + ... + x^n/n! (la exponencial truncada).
+# Las raíces se sacan como autovalores de la matriz compañera de P, que es de grado n (y no de P(s^2), de grado 2n),
+# con un paso de Newton para pulirlas. Cada raíz x da los polos s = ±j*sqrt(x), de los que se queda el del semiplano
+# izquierdo. Los arreglos son de sólo lectura, porque se comparten.
+def get_gauss_poles(n):
+    if n not in gauss_table:
+        coefs = 1 / factorial(np.arange(n + 1))
+        x = poly.polyroots(coefs) if n > 0 else np.array([])
+        x = x - poly.polyval(x, coefs) / poly.polyval(x, poly.polyder(coefs))
+        p = 1j * np.sqrt(x.astype(complex))
+        p = np.where(p.real < 0, p, -p)
+        p = np.where(abs(p.real) > 1e-10, p.real, 0) + 1j * np.where(abs(p.imag) > 1e-10, p.imag, 0)
+        g = np.prod(np.abs(p))
+        p.setflags(write=False)
+        gauss_table[n] = p, g
+    return gauss_table[n]
+
 
 class Gauss(Filter):
     def __init__(self, filter_type, filter_data, n, Q, nmin, nmax, Qmax, GD, tol):
@@ -12,29 +34,38 @@ class Gauss(Filter):
         if self.type == FilterType.GD:
             wpn = self.get_wan()
             if self.data.tol is None: self.data.tol = 0.1
-            n = nmin
-            for i in range(nmax - nmin):
-                [z, p, k] = self.get_fun(n)
-                '''w, mod, ph = ss.bode([b, a])
-                group_delay = np.divide(-np.diff(ph), np.diff(w))  # d(ph)/d(w)'''
-                w = np.linspace(wpn/10, wpn*10, num=1000)
-                w, gd = self.get_GD(w, z=z, p=p, k=k)
-                closest = (np.abs(w - wpn)).argmin()
-                if gd[closest] >= (1 - self.data.tol) * self.data.GD and not np.isnan(gd[closest]):
-                    break
-                n = n + 1
+
+            # Sólo hacen falta el retardo en wpn y en wpn/10 (la referencia)
+            def check(n):
+                [z, p, k] = self.get_prototype(n)
+                gd = group_delay(z, p, [wpn/10, wpn])
+                return gd[1] >= (1 - self.data.tol) * gd[0] and not np.isnan(gd[1])
         else:
-            n = nmin
-            for i in range(nmax - nmin):
-                z, p, k = self.get_fun(n)
+            def check(n):
+                z, p, k = self.get_prototype(n)
                 #k = k * self.fix_gain(ss.zpk2tf(z, p, k), FilterType.LP)
                 wap = np.linspace(min(1, self.get_wan()), max(1, self.get_wan()), 2)
-                wap, mod, ph = ss.bode([z, p, k], w=wap)
-                if np.around(mod[0]) >= -self.data.Ap and np.around(mod[1]) <= -self.data.Aa:
-                    break
-                n = n + 1
-        return n
+                wap, mod, ph, gd = zpk_response(z, p, k, wap)
+                return np.around(mod[0]) >= -self.data.Ap and np.around(mod[1]) <= -self.data.Aa
+            return self.search_n(check, nmin, nmax, self.get_first_n(nmin, nmax))
+        return self.search_n(check, nmin, nmax)
+
+    # get_first_n: Primer orden entre nmin y nmax - 1 que cumple la plantilla (nmax si ninguno), que es el n0 que
+    # necesita search_n en get_best_n (fuera del modo retardo de grupo), porque el chequeo no es monótono.
+    # La atenuación del prototipo es A(w) = 10 log10(P(w^2)), con P la exponencial truncada, así que se la calcula
+    # para todos los órdenes a la vez con la suma acumulada de los términos w^(2k)/k! y se toma el primero que cumple.
+    def get_first_n(self, nmin, nmax):
+        w = np.array([min(1, self.get_wan()), max(1, self.get_wan())])
+        k = np.arange(nmax + 1)
+        with np.errstate(over="ignore"):
+            A = 10 * np.log10(np.cumsum(np.power(w[:, np.newaxis], 2 * k) / factorial(k), axis=1))
+        ok = (np.around(-A[0]) >= -self.data.Ap) & (np.around(-A[1]) <= -self.data.Aa)
+        ns = np.flatnonzero(ok[nmin:nmax])
+        return nmin + ns[0] if len(ns) > 0 else nmax
+
 
+    def get_params(self):
+        return 0, 0
 
     def get_fun(self, n):
         '''num = np.poly1d([1])
@@ -49,28 +80,7 @@ class Gauss(Filter):
         z, p, k = ss.tf2zpk(num, den)
         p = [pole for pole in p if pole.real < 0]
         '''
-        poly = np.poly1d(1)
-        for n in np.arange(1, n + 1):
-            base = np.zeros(n + 1)
-            base[0] = 1 / factorial(n)
-            new_poly = np.poly1d(base)
-            poly = np.polyadd(poly, new_poly)
-
-        num = [1]
-        den = np.polyval(poly, np.poly1d([1, 0, 0]))
-
-        # z, p, k = ss.tf2zpk(num, den)
-        # p = [pole for pole in p if pole.real > 0]
-
-        g = 1
-        poles = []
-        for pole in 1j * den.roots:
-            if pole.real < 0:
-                new_pole = complex(pole.real if abs(pole.real) > 1e-10 else 0,
-                                   pole.imag if abs(pole.imag) > 1e-10 else 0)
-                g *= abs(new_pole)
-                poles.append(new_pole)
-
+        poles, g = get_gauss_poles(n)
         return [], poles, g
     '''
         return z, p, k'''
@@ -1,8 +1,41 @@
 import numpy as np
-import scipy.signal as ss
-from scipy.special import eval_legendre, legendre
+import numpy.polynomial.legendre as leg
+from back.response import zpk_response
 from back.FilterClass import Filter, ApproxType, FilterType
 
+# Tabla de coeficientes ya calculados por orden (ver get_ln_coefs)
+ln_table = {}
+
+# get_ln_coefs: Coeficientes (en la base de polinomios de Legendre) de F(u) = integral de -1 a u del cuadrado de la
+# sumatoria de polinomios de Legendre que define al polinomio óptimo L, de modo que Ln(w) = F(2w^2 - 1).
+# Se trabaja siempre en la base de Legendre (productos e integral por recurrencia), sin pasar por la base de potencias,
+# que pierde precisión en órdenes altos. Se guardan en ln_table, así que cada orden se calcula una sola vez.
+def get_ln_coefs(n):
+    if n not in ln_table:
+        if n == 0:
+            coefs = np.zeros(1)
+        else:
+            if n % 2:  # n impar
+                k = (n - 1) // 2
+                a0 = 1 / (np.sqrt(2) * (k + 1))
+                poly = a0 * (2 * np.arange(k + 1) + 1)
+                poly = leg.legmul(poly, poly)  # Elevo al cuadrado
+            else:  # n par
+                k = (n - 2) // 2
+                poly = np.zeros(k + 1)
+                if k % 2:  # k impar
+                    a1 = 3 / np.sqrt((k + 1) * (k + 2))
+                    poly[1::2] = a1 * (2 * np.arange(1, k + 1, 2) + 1) / 3
+                else:  # k par
+                    a0 = 1 / np.sqrt((k + 1) * (k + 2))
+                    poly[0::2] = a0 * (2 * np.arange(0, k + 1, 2) + 1)
+                poly = leg.legmul(poly, poly)  # Elevo al cuadrado
+                poly = leg.legmul(poly, [1, 1])  # Multiplico por (u + 1)
+            coefs = leg.legint(poly, lbnd=-1)  # Integro desde -1
+        coefs.setflags(write=False)
+        ln_table[n] = coefs
+    return ln_table[n]
+
 class Legendre(Filter):
     def __init__(self, filter_type, filter_data, n, Q, nmin, nmax, Qmax, GD):
         super().__init__(filter_type, ApproxType.LG, filter_data, n, Q, nmin, nmax, Qmax, None, GD, None)
@@ -10,81 +43,65 @@ class Legendre(Filter):
     def get_best_n(self, nmin, nmax):
         '''wan = self.get_wan()
         comp = np.log10(self.get_eps(self.data.Aa)**2 / self.get_eps(self.data.Ap)**2)'''
-        n = nmin
-        for i in range(nmax - nmin):
+        def check(n):
             '''l_n = self.ln(n)
             eva = np.polyval(l_n, [wan**2])[0]
             if eva >= comp:
                 break
             '''
-            z, p, k = self.get_fun(n)
+            z, p, k = self.get_prototype(n)
             wap = np.linspace(min(1, self.get_wan()), max(1, self.get_wan()), 2)
-            wap, mod, ph = ss.bode([z, p, k], w=wap)
-            if mod[0] >= -self.data.Ap * 1.0001 and mod[1] <= -self.data.Aa * 0.9999:
-                break
+            wap, mod, ph, gd = zpk_response(z, p, k, wap)
+            return mod[0] >= -self.data.Ap * 1.0001 and mod[1] <= -self.data.Aa * 0.9999
+        return self.search_n(check, nmin, nmax, self.estimate_n(nmin, nmax))
+
+    # get_attenuation: Atenuación [dB] del prototipo de orden n en las frecuencias w, sin calcular los polos:
+    # A(w) = 10 log10(1 + eps^2 * Ln(w^2)), con Ln(w^2) = F(2w^4 - 1) (ver get_ln_coefs)
+    def get_attenuation(self, n, w):
+        u = 2 * np.power(w, 4) - 1
+        return 10 * np.log10(1 + self.data.eps**2 * leg.legval(u, get_ln_coefs(n)))
+
+    # estimate_n: Estimación del orden con el que arranca la búsqueda de get_best_n.
+    # Fuera de [-1, 1] F crece como (u + sqrt(u^2 - 1))^n, lo que da una primera aproximación del orden que alcanza Aa
+    # en wan. Después se la corrige con la atenuación exacta (get_attenuation) hasta el primer orden que cumple.
+    def estimate_n(self, nmin, nmax):
+        w = np.array([min(1, self.get_wan()), max(1, self.get_wan())])
+        u = 2 * w[1]**4 - 1
+        if u <= 1:
+            return nmin
+        ratio = (np.power(10, self.data.Aa / 10) - 1) / self.data.eps**2
+        n = int(np.clip(np.ceil(np.log(ratio) / np.arccosh(u)), nmin, nmax))
+
+        def check(n):
+            A = self.get_attenuation(n, w)
+            return -A[0] >= -self.data.Ap * 1.0001 and -A[1] <= -self.data.Aa * 0.9999
+        while n < nmax and not check(n):
             n = n + 1
+        while n > nmin and check(n - 1):
+            n = n - 1
         return n
 
+    # ln: Polinomio óptimo Ln(w) (np.poly1d en potencias de w), armado a partir de get_ln_coefs
     def ln(self, n):
-        if n == 0:
-            return [0]
-
-        if n % 2:  # n impar
-            k = (n - 1) // 2
-            a0 = 1 / (np.sqrt(2) * (k + 1))
-
-            poly = np.poly1d([a0])
-            for i in range(1, k + 1):
-                ai = a0 * (2 * i + 1)
-                new_poly = ai * legendre(i)
-                poly = np.polyadd(poly, new_poly)   # Sumatoria
-            poly = np.polymul(poly, poly)  # Elevo al cuadrado
+        poly = np.poly1d(leg.leg2poly(get_ln_coefs(n))[::-1])
+        return np.polyval(poly, np.poly1d([2, 0, -1]))
 
-        else:  # n par
-            k = (n - 2) // 2
-            if k % 2:  # k impar
-                a1 = 3 / np.sqrt((k + 1) * (k + 2))
-                poly = np.poly1d(0)
-
-                for i in range(1, k + 1):
-                    if i % 2:  # i impar
-                        ai = a1 * (2 * i + 1)/3
-                        new_poly = ai * legendre(i)
-                        poly = np.polyadd(poly, new_poly)   # Sumatoria
-            else:  # k par
-                a0 = 1 / np.sqrt((k + 1) * (k + 2))
-                poly = np.poly1d(a0)
-
-                for i in range(1, k + 1):
-                    if not i % 2:  # i par
-                        ai = a0 * (2 * i + 1)
-                        new_poly = ai * legendre(i)
-                        poly = np.polyadd(poly, new_poly)   # Sumatoria
-
-            poly = np.polymul(poly, poly)  # Elevo al cuadrado
-            poly = np.polymul(poly, np.poly1d([1, 1]))  # Multiplico por (x + 1)
-
-        poly = np.polyint(poly)  # Integro
-        x2 = np.poly1d([2, 0, -1])  # Borde superior
-        x1 = np.poly1d([-1])  # Borde inferior
-
-        Ln = np.polysub(np.polyval(poly, x2), np.polyval(poly, x1))
-
-        return Ln
+    def get_params(self):
+        return self.data.Ap, 0
 
+    # get_fun: Los polos son las raíces de 1 + eps^2 * Ln(s^2) del semiplano izquierdo.
+    # Con u = 2s^4 - 1 alcanza con encontrar las n raíces de 1 + eps^2 * F(u) (con la matriz compañera en la base de
+    # Legendre, bien condicionada) y de cada una sacar las 4 raíces cuartas de (u + 1) / 2.
     def get_fun(self, n):
-        l_n = self.ln(n)
-        num = np.poly1d([1])
-        den = self.data.eps**2 * np.polyval(l_n, np.poly1d([1, 0, 0]))
-        den = np.polyadd(den, 1)
-        z, p, g = ss.tf2zpk(num, den)
-        p = [pole for pole in p if pole.real < 0]
-        num, den = ss.zpk2tf(z, p, g)
-        if num[-1] != 0:
-            k = den[-1] / num[-1]
-        else:
-            k = 1
-        return z, p, k * g
+        coefs = self.data.eps**2 * get_ln_coefs(n)
+        coefs[0] += 1
+        u = leg.legroots(coefs) if n > 0 else np.array([])
+        r = np.power((u.astype(complex) + 1) / 2, 1 / 4)
+        s4 = np.concatenate([r * 1j**i for i in range(4)])
+        p = s4[s4.real < 0]
+        z = np.array([])
+        k = np.prod(-p).real
+        return z, p, k
 
 
 
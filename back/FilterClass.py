@@ -1,8 +1,19 @@
 import numpy as np
 import scipy.signal as ss
 import matplotlib.pyplot as plt
+import logging
+import contextvars
+from scipy.optimize import brentq
 from enum import IntEnum
+from copy import copy
+from itertools import count
+from collections import namedtuple
 from back.stage_handler import *
+from back.response import zpk_response, zpk_mod, group_delay, sos_response, sos_lsim, tf_to_sos, iter_response, export_response
+from back.grid import default_grid, default_lin_grid, adaptive_response
+from back import prototypes
+
+logger = logging.getLogger(__name__)
 
 # TIPOS DE FILTROS
 class FilterType(IntEnum):
@@ -26,6 +37,46 @@ class ApproxType(IntEnum):
 ftypes = ["lowpass", "highpass", "bandpass", "bandstop", "group delay"]
 atypes = ["Butterworth", "Cheby I", "Cheby II", "Legendre", "Cauer", "Bessel", "Gauss"]
 
+# Identificadores únicos de cada filtro calculado (los usa la caché de respuestas)
+filter_uids = count()
+
+# Resultado de la búsqueda de orden con Q acotado (ver Filter.search_Q):
+# - feasible: Si hay algún orden que cumpla con Qmax
+# - n: Orden encontrado (None si no hay)
+# - Q: Q máximo de los polos con ese orden (None si no hay)
+# - message: Mensaje de error ("" si hay solución)
+QSearchResult = namedtuple("QSearchResult", ["feasible", "n", "Q", "message"])
+
+# Evento (threading.Event) con el que se cancela el diseño que corre en el contexto actual, o None si no se puede
+# cancelar. Las búsquedas de orden lo revisan con check_cancelled antes de evaluar cada orden (ver FilterSpace.run_async).
+cancel_event = contextvars.ContextVar("cancel_event", default=None)
+
+
+# DesignCancelled: Se canceló el diseño (o el cálculo) en curso
+class DesignCancelled(Exception):
+    pass
+
+
+# check_cancelled: Corta con DesignCancelled si se activó el evento de cancelación del contexto actual
+def check_cancelled():
+    event = cancel_event.get()
+    if event is not None and event.is_set():
+        raise DesignCancelled("Se canceló el diseño")
+    return
+
+
+# Etapas del diseño de un filtro, en el orden en que se calculan (ver Filter.design):
+# - "order": Orden (get_n, o el n pedido)
+# - "qmax": Búsqueda del orden con Q acotado (search_Q)
+# - "denormalize": Prototipo (get_zpk), desnormalización (con get_desfactor) y Q de los polos
+# - "gain": Ganancia G, num/den y SOS
+design_stages = ["order", "qmax", "denormalize", "gain"]
+
+# Primera etapa que hay que recalcular cuando cambia cada parámetro (ver Filter.update)
+update_stages = {"wp": "order", "wa": "order", "Ap": "order", "Aa": "order", "rp": "order", "GD": "order", "tol": "order",
+                 "n": "order", "Q": "order", "nmin": "order", "nmax": "order", "Qmax": "qmax", "des": "denormalize",
+                 "G": "gain"}
+
 # DATOS PARA EL FILTRO
 class FilterData:
     def __init__(self, wp, wa, Ap, Aa, des, G):
@@ -84,7 +135,113 @@ class FilterData:
 
 class Filter:
     def __init__(self, filter_type, approx, filter_data, n=None, Q=None, nmin=None, nmax=None, Qmax=None, rp=None, GD=None, tol=None):
+        self.init_data(filter_type, approx, filter_data, rp, GD, tol)
+        self.args = {"n": n, "Q": Q, "nmin": nmin, "nmax": nmax, "Qmax": Qmax, "rp": rp, "GD": GD, "tol": tol}
+        self.design("order")
+
+    # design: Calcula el filtro desde la etapa stage (ver design_stages) en adelante, con los parámetros de self.args y
+    # lo que guardaron en self.stage_data las etapas anteriores:
+    # - "n", "Q": Orden y data.Q al terminar "order"
+    # - "qn", "qQ": Orden y data.Q al terminar "qmax" (search_Q deja en data.Q el Q del último orden descartado)
+    # - "g": Ganancia desnormalizada, antes de multiplicarla por G
+    def design(self, stage):
+        start = design_stages.index(stage)
+        if start <= 0:
+            self.data.Q = None
+            n = self.args["n"]
+            if n is not None: self.data.n = n
+            else: n = self.get_n(self.args["nmin"], self.args["nmax"])
+            if self.args["Q"] is not None: self.data.Q = self.args["Q"]
+            self.stage_data = {"n": n, "Q": self.data.Q}
+        if start <= 1:
+            n = self.stage_data["n"]
+            self.data.Q = self.stage_data["Q"]
+            Qmax = self.args["Qmax"]
+            self.q_search = None
+            if Qmax is not None:
+                self.q_search = self.search_Q(n, Qmax)
+                if not self.q_search.feasible:
+                    self.data.n = n
+                    self.name = ftypes[self.type].capitalize() + " " + atypes[self.approx] + " order " + str(self.data.n)
+                    self.zeros, self.poles, self.data.g = np.array([]), np.array([]), 0
+                    self.error = self.q_search.message
+                    print(self.error)
+                    self.filter_error()
+                    return
+                n = self.q_search.n
+            self.stage_data.update({"qn": n, "qQ": self.data.Q})
+        if start <= 2:
+            n = self.stage_data["qn"]
+            self.data.Q = self.stage_data["qQ"]
+            self.zeros, self.poles, self.data.g = self.get_zpk(n)
+            self.zeros, self.poles, self.data.g = self.denormalize()
+            self.check_Q(self.args["Qmax"])
+            self.data.n = n
+            self.stage_data["g"] = self.data.g
+        self.data.g = self.stage_data["g"] * self.data.G
+        self.build_outputs()
+        return
+
+    # update: Cambia los parámetros changes (los de data: wp, wa, Ap, Aa, des, G; o los de diseño: n, Q, nmin, nmax,
+    # Qmax, rp, GD, tol, en las mismas unidades que recibe el constructor) y recalcula sólo las etapas que dependen de
+    # ellos (ver update_stages). Si sólo cambia G se reescalan la ganancia, el numerador y la primera sección SOS.
+    # Si el nuevo diseño no se puede hacer, el filtro queda como estaba. Si cambia, recibe un uid nuevo y se descartan
+    # las etapas armadas a mano (cambiaron los polos). Devuelve el mensaje de error ("" si se pudo).
+    def update(self, **changes):
+        for name in changes:
+            if name not in update_stages:
+                raise TypeError("Filter.update no recibe el parámetro " + name)
+        if len(changes) == 0:
+            return ""
+        stage = min([self.get_update_stage(name) for name in changes], key=design_stages.index)
+        # Los filtros restaurados de la caché de diseños no tienen las etapas intermedias: se recalcula todo
+        needed = {"order": [], "qmax": ["n", "Q"], "denormalize": ["qn", "qQ"], "gain": ["g"]}[stage]
+        if any([key not in self.stage_data for key in needed]):
+            stage = "order"
+
+        f = copy(self)
+        f.data = copy(self.data)
+        f.args = dict(self.args)
+        f.stage_data = dict(self.stage_data)
+        for name, value in changes.items():
+            if name in f.args: f.args[name] = value
+            else: setattr(f.data, name, value)
+
+        if stage == "gain" and self.data.G != 0:
+            ratio = f.data.G / self.data.G
+            f.data.g = self.data.g * ratio
+            f.num = self.num * ratio
+            f.sos = self.sos.copy()
+            f.sos[0, :3] = f.sos[0, :3] * ratio
+        else:
+            if stage == "order":
+                # Lo mismo que init_data antes de buscar el orden
+                f.data.eps = f.get_eps(f.data.Ap)
+                f.data.wan = f.get_wan()
+                f.data.rp, f.data.GD, f.data.tol = f.args["rp"], f.args["GD"], f.args["tol"]
+            f.design(stage)
+            if f.type == FilterType.ERR:
+                return f.error
+            if ": " in self.name:
+                f.name = self.name[:self.name.index(": ") + 2] + f.name
+            f.pole_pairs, f.pole_pair_names, f.zero_pairs, f.zero_pair_names = [], [], [], []
+            f.stage_names, f.stages = [], []
+        f.uid = next(filter_uids)
+        self.__dict__.update(f.__dict__)
+        return ""
+
+    # get_update_stage: Primera etapa que depende del parámetro name. En pasa banda y rechaza banda el factor de
+    # desnormalización se aplica antes de la transformación de frecuencia y cambia el Q de los polos, así que des también
+    # afecta a la búsqueda con Q acotado.
+    def get_update_stage(self, name):
+        if name == "des" and self.type in [FilterType.BP, FilterType.BR]:
+            return "qmax"
+        return update_stages[name]
+
+    # init_data: Datos del filtro previos al diseño (todo lo que hace __init__ antes de buscar el orden)
+    def init_data(self, filter_type, approx, filter_data, rp=None, GD=None, tol=None):
         self.type = filter_type
+        self.uid = next(filter_uids)
         '''self.wp = wp
         self.wa = wa
         self.Ap = Ap
@@ -107,21 +264,19 @@ class Filter:
         self.zero_pair_names = []
         self.stage_names = []
         self.stages = []
-        if n is not None: self.data.n = n
-        else: n = self.get_n(nmin, nmax)
-        if Q is not None: self.data.Q = Q
-        self.zeros, self.poles, self.data.g = self.get_zpk(n)
-        self.zeros, self.poles, self.data.g = self.denormalize()
-        while not self.check_Q(Qmax):
-            n = n - 1
-            self.zeros, self.poles, self.data.g = self.get_zpk(n)
-            self.zeros, self.poles, self.data.g = self.denormalize()
-            if len(self.poles) == 0:
-                print("No existe aproximación que cumpla con el Q máximo pretendido")
-        self.data.n = n
+        self.n_evals = 0    # Órdenes evaluados en la búsqueda de n (ver search_n)
+        self.q_search = None    # Resultado de la búsqueda con Q acotado (ver search_Q)
+        self.error = ""         # Motivo por el que no se pudo crear el filtro
+        self.args = {}          # Parámetros de diseño (ver update)
+        self.stage_data = {}    # Resultados intermedios de cada etapa del diseño (ver design)
+        return
+
+    # build_outputs: Nombre, num/den y SOS a partir de los ceros, polos, ganancia y orden ya calculados
+    def build_outputs(self):
         self.name = ftypes[self.type].capitalize() + " " + atypes[self.approx] + " order " + str(self.data.n)
-        self.data.g = self.data.g * self.data.G
         self.num, self.den = self.get_numden()
+        self.sos = self.get_sos()
+        return
 
     def add_name_index(self, i):
         self.name = "C" + str(i) + ": " + self.name
@@ -132,6 +287,60 @@ class Filter:
         n = 0
         return n
 
+    # search_n: Búsqueda del orden para las aproximaciones que se calculan iterativamente.
+    # check(n) indica si el orden n cumple con la plantilla, y se supone monótono (si n cumple, n + 1 también).
+    # Devuelve lo mismo que recorrer n = nmin, ..., nmax - 1 hasta el primero que cumple (o nmax si ninguno cumple),
+    # pero primero avanza duplicando el paso hasta pasarse y después bisecta, así que evalúa O(log(nmax - nmin)) órdenes.
+    # Si se tiene una estimación n0 del orden, se arranca desde ahí: si n0 cumple se baja duplicando el paso hasta el
+    # primero que no cumple, y si no, se sube. Con una buena estimación alcanza con verificar n0 y n0 - 1.
+    # Si check no es monótono (Bessel y Gauss fuera del modo retardo de grupo) la búsqueda no sirve para encontrarlo, así
+    # que n0 tiene que ser exactamente el primer orden que cumple: entonces sólo se verifican n0 y n0 - 1.
+    # Antes de cada evaluación se revisa si se canceló el diseño (check_cancelled).
+    def search_n(self, check, nmin, nmax, n0=None):
+        def evaluate(n):
+            check_cancelled()
+            return check(n)
+
+        evals = 0
+        lo = nmin - 1   # Último orden que se sabe que no cumple
+        hi = nmax       # Primer orden que se sabe que cumple (nmax se acepta sin evaluarlo)
+        if n0 is not None:
+            n0 = min(max(n0, nmin), nmax)
+            passed = n0 == nmax
+            if not passed:
+                evals += 1
+                passed = evaluate(n0)
+            if passed:
+                hi = n0
+                step = 1
+                while lo + 1 < hi:
+                    n = max(hi - step, lo + 1)
+                    evals += 1
+                    if not evaluate(n):
+                        lo = n
+                        break
+                    hi = n
+                    step = step * 2
+            else:
+                lo = n0
+        step = 1
+        while lo + 1 < hi and hi == nmax:
+            n = min(lo + step, hi - 1)
+            evals += 1
+            if evaluate(n):
+                hi = n
+                break
+            lo = n
+            step = step * 2
+        while lo + 1 < hi:
+            n = (lo + hi) // 2
+            evals += 1
+            if evaluate(n): hi = n
+            else: lo = n
+        self.n_evals = evals
+        logger.info("%s %s: n = %d después de evaluar %d órdenes (de %d a %d)", ftypes[self.type], atypes[self.approx], hi, evals, nmin, nmax)
+        return hi
+
     # get_wan: Calcula la wa normalizada
     def get_wan(self):
         if self.type == FilterType.LP:
@@ -234,10 +443,25 @@ class Filter:
         wo = -1.0
         return wo'''
 
-    '''# get_sos: Obtiene la función del filtro
+    # get_sos: Obtiene la función del filtro como cascada de secciones de segundo orden (filas [b0, b1, b2, a0, a1, a2])
+    # A diferencia de num/den, no pierde precisión en órdenes altos. Si zpk2sos no puede emparejar las raíces (le pasa,
+    # por ejemplo, con el único cero real en el origen de algunos pasa banda de orden impar), se arma una sección por
+    # cada par de polos conjugados.
     def get_sos(self):
-        sos = ss.zpk2sos(self.zeros, self.poles, self.data.k)
-        return sos'''
+        try:
+            sos = ss.zpk2sos(self.zeros, self.poles, self.data.g, analog=True)
+        except (IndexError, ValueError):
+            pole_pairs = get_stage_pairs(self.poles)
+            zero_pairs = get_stage_pairs(self.zeros)
+            nums = []
+            dens = []
+            for i in range(max(len(pole_pairs), len(zero_pairs))):
+                num, den = get_stage_tf(zero_pairs[i] if i < len(zero_pairs) else [], pole_pairs[i] if i < len(pole_pairs) else [], 1)
+                nums.append(np.real(num))
+                dens.append(np.real(den))
+            sos = tf_to_sos(nums, dens)
+            sos[0, :3] = sos[0, :3] * self.data.g
+        return sos
 
     '''
     def parse_sos(self, sos):
@@ -255,10 +479,9 @@ class Filter:
 
     def get_desfactor(self, wp, wa):
         if self.approx != ApproxType.CH2 and self.data.Q is None:
-            w, mod, ph = ss.bode([self.zeros, self.poles, self.data.g], w=np.linspace(wp / 10, wa * 5, num=100000))
-            stop_band = [w for w, mod in zip(w, mod) if mod <= (-self.data.Aa)]
-            if len(stop_band) == 0: adjust = 1
-            else: adjust = (((wa - stop_band[0]) / stop_band[0]) * self.data.des + 1)
+            ws = self.get_wstop(wp / 10, wa * 5)
+            if ws is None: adjust = 1
+            else: adjust = (((wa - ws) / ws) * self.data.des + 1)
         else:
             adjust = 1
 
@@ -268,22 +491,81 @@ class Filter:
 
         return adjust
 
+    # get_wstop: Primera frecuencia entre wmin y wmax en la que el módulo cae por debajo de -Aa (None si no cae).
+    # Se ubica el cruce en una grilla gruesa y después se lo refina con brentq sobre |H(jw)| = -Aa.
+    def get_wstop(self, wmin, wmax):
+        w = np.geomspace(wmin, wmax, 64)
+        mod = zpk_mod(self.zeros, self.poles, self.data.g, w)
+        ixs = np.flatnonzero(mod <= -self.data.Aa)
+        if len(ixs) == 0:
+            return None
+        if ixs[0] == 0:
+            return w[0]
+        fun = lambda x: zpk_mod(self.zeros, self.poles, self.data.g, x)[0] + self.data.Aa
+        return brentq(fun, w[ixs[0] - 1], w[ixs[0]], xtol=1E-12 * wmax)
+
+    # get_params: Parámetros del prototipo normalizado con los que se lo busca en back/prototypes.py
+    # (None si la aproximación no está tabulada)
+    def get_params(self):
+        return None
+
+    # get_prototype: Prototipo normalizado de orden n. Sale de la memoria de prototipos ya usados o de la biblioteca
+    # de prototipos y, si no está en ninguna (parámetros fuera de la grilla, orden muy alto o biblioteca sin armar), se lo
+    # calcula con get_normalized_fun (ver prototypes.get). Los arreglos que devuelve son de sólo lectura.
+    def get_prototype(self, n):
+        params = self.get_params()
+        if params is None:
+            return self.get_fun(n)
+        return self.scale_prototype(*prototypes.get(self.approx, n, *params, lambda: self.get_normalized_fun(n)))
+
+    # get_normalized_fun: Prototipo con la normalización de la biblioteca (el que recibe scale_prototype)
+    def get_normalized_fun(self, n):
+        return self.get_fun(n)
+
+    # scale_prototype: Lleva el prototipo de la biblioteca a lo que devolvería get_fun
+    def scale_prototype(self, z, p, k):
+        return z, p, k
+
     def get_zpk(self, n):
-        z, p, g = self.get_fun(n)
+        z, p, g = self.get_prototype(n)
         z = np.around(z, 5)
         p = np.around(p, 5)
         return z, p, g
 
     def check_Q(self, Qmax):
         r = True
-        Q = []
-        for pole in self.poles:
-            Q.append(abs(abs(pole) / (2 * pole.real)))
-        self.data.Q = max(Q)
+        self.data.Q = self.get_Q(self.poles)
         if Qmax is not None and self.data.Q > Qmax:
             r = False
         return r
 
+    # get_Q: Máximo Q de los polos p
+    def get_Q(self, p):
+        Q = []
+        for pole in p:
+            Q.append(abs(abs(pole) / (2 * pole.real)))
+        return max(Q)
+
+    # search_Q: Busca, bajando desde n, el mayor orden cuyos polos no superan Qmax. Devuelve un QSearchResult.
+    # Las transformaciones pasa bajos, pasa altos y el escalado de desnormalización no cambian el Q de los polos, así que
+    # en esos casos se mira directamente el prototipo normalizado. Pasa banda y rechaza banda sí lo cambian, y hay que
+    # desnormalizar cada candidato.
+    def search_Q(self, n, Qmax):
+        for m in range(n, 0, -1):
+            check_cancelled()
+            if self.type in [FilterType.LP, FilterType.HP, FilterType.GD]:
+                Q = self.get_Q(self.get_prototype(m)[1])
+            else:
+                self.zeros, self.poles, self.data.g = self.get_zpk(m)
+                self.zeros, self.poles, self.data.g = self.denormalize()
+                Q = self.get_Q(self.poles)
+            if Q <= Qmax:
+                return QSearchResult(True, m, Q, "")
+            # Como antes, una vez que hubo que bajar el orden ya no se aplica el factor de desnormalización
+            # (get_desfactor sólo lo aplica mientras data.Q es None)
+            self.data.Q = Q
+        return QSearchResult(False, None, None, "No existe aproximación que cumpla con el Q máximo pretendido")
+
     def get_numden(self):
         num, den = ss.zpk2tf(self.zeros, self.poles, self.data.g)
         return num, den
@@ -300,15 +582,19 @@ class Filter:
 
     def get_GD(self, w=None, z=None, p=None, k=None):
         if w is None:
-            wmin, wmax = self.get_wminmax()
-            w = np.linspace(wmin, wmax, num=int(10*wmax/wmin))
+            w = self.get_adaptive_response()[0]
         if z is None: z = self.zeros
         if p is None: p = self.poles
         if k is None: k = self.data.g
 
-        w, mod, ph = ss.bode([z, p, k], w)
-        gd = np.divide(- np.diff(ph), np.diff(w))
-        gd = np.append(gd, gd[len(gd) - 1])
+        w = np.atleast_1d(np.asarray(w, dtype=float))
+        gd = self.normalize_GD(group_delay(z, p, w))
+
+        return w, gd
+
+    # normalize_GD: Escala el retardo de grupo analítico como lo muestra get_GD
+    def normalize_GD(self, gd):
+        gd = np.degrees(gd)
         if self.data.GD is not None: GD = self.data.GD
         elif gd[0] != 0 and not np.isnan(gd[0]):
             GD = 1/gd[0]
@@ -316,8 +602,52 @@ class Filter:
             gd[0] = 1E-15
             GD = 1/gd[0]
         gd = gd*GD/gd[0]
+        return gd
 
-        return w, gd
+    # get_response: Evalúa la transferencia del filtro en w a partir de sus ceros y polos.
+    # Devuelve w, módulo [dB], fase [°] y retardo de grupo
+    def get_response(self, w):
+        return zpk_response(self.zeros, self.poles, self.data.g, w)
+
+    # iter_response: Genera la respuesta de a bloques de chunk puntos para barridos muy densos (num puntos en total).
+    # Si no se da el rango se usa el de get_wminmax.
+    def iter_response(self, wmin=None, wmax=None, num=1000000, chunk=65536, scale="log"):
+        if wmin is None or wmax is None:
+            wmin, wmax = self.get_wminmax()
+        return iter_response(self.zeros, self.poles, self.data.g, wmin, wmax, num, chunk, scale)
+
+    # export_response: Guarda la respuesta (w, mod, ph, gd) en un archivo .npy sin tenerla entera en memoria
+    def export_response(self, path, wmin=None, wmax=None, num=1000000, chunk=65536, scale="log"):
+        if wmin is None or wmax is None:
+            wmin, wmax = self.get_wminmax()
+        return export_response(path, self.zeros, self.poles, self.data.g, wmin, wmax, num, chunk, scale)
+
+    # get_sos_response: Igual que get_response pero evaluando la matriz SOS sección por sección
+    def get_sos_response(self, w):
+        return sos_response(self.sos, w)
+
+    # get_time_response: Respuesta temporal a la entrada u en los instantes t [s], simulada sección por sección.
+    # Los polos y ceros (y por lo tanto la matriz SOS) están divididos por 2π, así que H(s) = Hsos(s / 2π) y la
+    # respuesta en t es la que da la matriz SOS en 2π t.
+    def get_time_response(self, u, t):
+        return t, sos_lsim(self.sos, u, 2 * np.pi * np.asarray(t, dtype=float))
+
+    # get_step: Respuesta al escalón. Si no se da t, se simulan 10 constantes de tiempo del polo más lento.
+    def get_step(self, t=None):
+        if t is None:
+            t = np.linspace(0, 10 / (2 * np.pi * np.min(np.abs(self.poles.real))), 2000)
+        return self.get_time_response(np.ones(len(t)), t)
+
+    # get_group_delay: Retardo de grupo analítico del filtro en w (sin normalizar, a diferencia de get_GD)
+    def get_group_delay(self, w):
+        return group_delay(self.zeros, self.poles, w)
+
+    # get_adaptive_response: Igual que get_response pero con una grilla adaptiva de a lo sumo budget puntos,
+    # refinada alrededor de resonancias y ceros de transmisión. Si no se da el rango se usa el de get_wminmax.
+    def get_adaptive_response(self, wmin=None, wmax=None, budget=400):
+        if wmin is None or wmax is None:
+            wmin, wmax = self.get_wminmax()
+        return adaptive_response(self.zeros, self.poles, self.data.g, wmin, wmax, budget)
 
     def get_wminmax(self):
         if self.type <= FilterType.HP:
@@ -396,11 +726,13 @@ class Filter:
     #         - c: color
     #         - w: arreglo de w
     #         - A: Atenuación (True) o Ganancia (False)
-    def plot_mod(self, ax, c, w=None, A=False, N=True):
-        if w is None:
+    #         - mod: Módulo ya calculado en w (por ejemplo, desde la caché de respuestas)
+    def plot_mod(self, ax, c, w=None, A=False, N=True, mod=None):
+        if mod is None and w is None:
             wmin, wmax = self.get_wminmax()
-            w = np.linspace(wmin / (2 * np.pi), wmax / (2 * np.pi), int(wmax / wmin * 10))
-        w, mod, ph = ss.bode([self.num, self.den], w)
+            w, mod, ph, gd = self.get_adaptive_response(wmin / (2 * np.pi), wmax / (2 * np.pi))
+        elif mod is None:
+            w, mod, ph, gd = self.get_response(w)
         if A:
             mod = - mod + 20*np.log10(self.data.G)
         #if N and self.type <= FilterType.HP: w = w / (min(self.data.wa, self.data.wp) / (2 * np.pi))
@@ -408,19 +740,20 @@ class Filter:
         ax.semilogx(w, mod, label=self.name, color=c)
         return
 
-    def plot_ph(self, ax, c,  w=None):
-        if w is None:
-            wmin, wmax = self.get_wminmax()
-            w = np.linspace(wmin, wmax, int(wmax / wmin * 10))
-        w, mod, ph = ss.bode([self.num, self.den], w)
+    def plot_ph(self, ax, c,  w=None, ph=None):
+        if ph is None and w is None:
+            w, mod, ph, gd = self.get_adaptive_response()
+        elif ph is None:
+            w, mod, ph, gd = self.get_response(w)
         ax.semilogx(w, ph, label=self.name, color=c)
         return
 
-    def plot_gd(self, ax, c, w=None):
-        if w is None:
-            wmin, wmax = self.get_wminmax()
-            w = np.linspace(wmin, wmax, int(wmax / wmin * 10))
-        w, gd = self.get_GD(w)
+    def plot_gd(self, ax, c, w=None, gd=None):
+        if gd is None:
+            if w is None:
+                wmin, wmax = self.get_wminmax()
+                w = default_lin_grid.get(wmin, wmax)
+            w, gd = self.get_GD(w)
         ax.plot(w, gd, label=self.name, color=c)
         return
 
@@ -434,7 +767,7 @@ class Filter:
         print("type: " + ftypes[self.type])
         print("approx: " + atypes[self.approx])
         self.data.print_data()
-        #print("sos:\n", self.sos)
+        print("sos:\n", self.sos)
         print("\t \t", self.num)
         print("H(s) = -----------------------------------------------------------------")
         print("\t \t", self.den)
@@ -551,10 +884,12 @@ class Filter:
         for i in ixs:
             nums.append(self.stages[i][0])
             dens.append(self.stages[i][1])
-        combined_tf = combine_tf(nums, dens)
+        # Se evalúa etapa por etapa en lugar de multiplicar los polinomios (combine_tf), que pierde precisión
+        sos = tf_to_sos(nums, dens)
 
         ax.grid()
-        w, mod, k = ss.bode(combined_tf)
+        wmin, wmax = self.get_wminmax()
+        w, mod, ph, gd = sos_response(sos, default_grid.get(wmin / (2 * np.pi), wmax / (2 * np.pi)))
         ax.semilogx(w, mod, color="blue")
 
         ax.set_title("Combined Stages")
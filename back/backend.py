@@ -1,8 +1,15 @@
+import os
+import re
+import asyncio
+import threading
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 from copy import copy
-from back.FilterClass import FilterType, FilterData, ApproxType
+from collections import namedtuple
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from back.FilterClass import FilterType, FilterData, ApproxType, QSearchResult, DesignCancelled, filter_uids, cancel_event, check_cancelled
 from back.Approx.butterworth import Butterworth
 from back.Approx.bessel import Bessel
 from back.Approx.legendre import Legendre
@@ -10,52 +17,211 @@ from back.Approx.cheby1 import ChebyI
 from back.Approx.cheby2 import ChebyII
 from back.Approx.cauer import Cauer
 from back.Approx.gauss import Gauss
+from back.grid import FreqGrid
+from back.cache import ResponseCache
+from back.design_cache import get_key
+from back import prototypes
 
 class FilterSpace:
-    def __init__(self):
+    # workers: Cantidad de hilos para calcular las respuestas (1 calcula todo en el hilo que llama)
+    # design_cache: DesignCache con los diseños guardados en disco (None para diseñar siempre)
+    def __init__(self, workers=1, design_cache=None):
         self.filters = []       # Arreglo de filtros
         self.w_unit = "Hz"      # Unidad de frecuencia
         self.mod_unit = "dB"    # Unidad de módulo
         self.ph_unit = "°"      # Unidad de fase
+        self.grid = FreqGrid()                  # Grilla de frecuencias para módulo y fase
+        self.gd_grid = FreqGrid(scale="lin")    # Grilla de frecuencias para el retardo de grupo (eje lineal)
+        self.cache = ResponseCache(maxsize=256)  # Respuestas ya calculadas
+        self.workers = workers  # Hilos para calcular las respuestas
+        self.pool = None        # Pool de hilos (se crea la primera vez que hace falta)
+        self.design_cache = design_cache    # Diseños ya calculados (en disco)
+        self.requests = {}      # Clave -> evento de cancelación del último pedido asincrónico con esa clave (ver run_async)
 
     # addFilter: Recibe parámetros para el filtro y si tienen sentido, lo crea.
     # Devuelve True si pudo crearlo, False si no.
     # OJO: LAS FRECUENCIAS SE INGRESAN EN RAD/S (Chaquear esto desde el front)
     def addFilter(self, filter_type, approx, wp, wa, Ap, Aa, des, G=1, n=None, Q=None, nmin=None, nmax=None, Qmax=None, rp=None, GD=None, tol=None):
-        m = self.check_filter(filter_type, approx, wp, wa, Ap, Aa)
-        if m != "":
+        f, m = design_filter((filter_type, approx, wp, wa, Ap, Aa, des, G, n, Q, nmin, nmax, Qmax, rp, GD, tol), self.design_cache)
+        return self.add_result(f, m)
+
+    # add_result: Agrega el filtro f que devolvió design_filter (si se pudo crear) y devuelve el mensaje m
+    def add_result(self, f, m):
+        if f is None:
             print("No se pudo crear el filtro")
             return m
-        wp, wa = self.check_symmetry(filter_type, wp, wa)
-        f = switch_atypes.get(approx)(filter_type, wp, wa, Ap, Aa, des/100, G, n, Q, nmin, nmax, Qmax, rp, GD, tol)
         f.add_name_index(self.get_name_index())
         if f.type != FilterType.ERR:
             self.filters.append(f)
         else:
             print("Error al crear el filtro")
             del f
-        return ""
+        return m
+
+    # run_async: Corre fn(*args) en el pool de hilos (o en el ejecutor por defecto de asyncio, con un único hilo) sin
+    # bloquear el bucle de eventos, y devuelve su resultado.
+    # - timeout: Segundos máximos de espera (al vencerse se lanza asyncio.TimeoutError)
+    # - key: Si se pasa, un pedido nuevo con la misma clave descarta al anterior (el que quedó viejo termina con
+    #   DesignCancelled en vez de esperar su turno), por ejemplo para no acumular diseños mientras se mueve un control.
+    # Al cancelarse la tarea, vencerse el tiempo o quedar viejo el pedido, se activa su evento de cancelación y el cálculo
+    # se corta en la próxima revisión de check_cancelled (los hilos no se pueden interrumpir de otra forma).
+    async def run_async(self, fn, *args, timeout=None, key=None):
+        event = threading.Event()
+        if key is not None:
+            if key in self.requests:
+                self.requests[key].set()
+            self.requests[key] = event
+        try:
+            r = await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(self.get_pool(), run_cancellable, event, fn, *args), timeout)
+            if event.is_set():
+                raise DesignCancelled("Se descartó el pedido")
+            return r
+        except BaseException:
+            event.set()
+            raise
+        finally:
+            if key is not None and self.requests.get(key) is event:
+                del self.requests[key]
+
+    # add_filter: Versión asincrónica de addFilter (el diseño corre en otro hilo, ver run_async)
+    async def add_filter(self, filter_type, approx, wp, wa, Ap, Aa, des, G=1, n=None, Q=None, nmin=None, nmax=None, Qmax=None, rp=None, GD=None, tol=None, timeout=None, key=None):
+        spec = (filter_type, approx, wp, wa, Ap, Aa, des, G, n, Q, nmin, nmax, Qmax, rp, GD, tol)
+        f, m = await self.run_async(design_filter, spec, self.design_cache, timeout=timeout, key=key)
+        return self.add_result(f, m)
+
+    # evaluate: Calcula en otro hilo (ver run_async) la magnitud quantity ("mod", "ph" o "gd") de los filtros visibles,
+    # con las mismas grillas y la misma caché que los gráficos. Devuelve la lista de (w, valores) de cada filtro visible.
+    async def evaluate(self, quantity, wmin=None, wmax=None, timeout=None, key=None):
+        if wmin is None or wmax is None:
+            wmin, wmax = [w / (2 * np.pi) for w in self.get_wminmax()]
+        fs = [f for f in self.filters if f.visibility]
+        grid = self.gd_grid if quantity == "gd" else self.grid
+        return await self.run_async(self.get_quantities, fs, quantity, grid, wmin, wmax, timeout=timeout, key=key)
+
+    # get_quantities: Magnitud quantity de los filtros fs en la grilla grid (llenando antes la caché de una sola vez)
+    def get_quantities(self, fs, quantity, grid, wmin, wmax):
+        self.cache.fill(fs, quantity, grid, wmin, wmax)
+        rs = []
+        for f in fs:
+            check_cancelled()
+            rs.append(self.cache.get_quantity(f, quantity, grid, wmin, wmax, count=False))
+        return rs
+
+    # addFilters: Igual que addFilter pero para una lista de plantillas (ver get_spec_args), diseñadas con design_many.
+    # Agrega los filtros que se pudieron crear en el orden de specs y devuelve el mensaje de cada plantilla
+    # ("" si se creó el filtro).
+    def addFilters(self, specs, processes=None):
+        rs = self.design_many(specs, processes)
+        fs = [f for f, m in rs if f is not None and f.type != FilterType.ERR]
+        for f, i in zip(fs, self.get_name_indexes(len(fs))):
+            f.add_name_index(i)
+            self.filters.append(f)
+        return [m for f, m in rs]
+
+    # design_many: Diseña los filtros de todas las plantillas de specs (lista de plantillas o arreglo estructurado, ver
+    # get_spec_args) sin agregarlos al FilterSpace. Las plantillas se reparten entre processes procesos (por defecto
+    # uno por núcleo); con un único proceso, o con pocas plantillas, se diseñan en este mismo.
+    # Devuelve un DesignResult por plantilla, en el orden de specs (ver design_spec: si alguna lanza una excepción, su
+    # mensaje es el de la excepción).
+    def design_many(self, specs, processes=None):
+        specs = list(specs)
+        processes = (os.cpu_count() or 1) if processes is None else processes
+        if processes <= 1 or len(specs) < 2 * processes:
+            return [design_spec(spec, self.design_cache) for spec in specs]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            design = partial(design_spec, cache=self.design_cache)
+            rs = list(pool.map(design, specs, chunksize=max(1, len(specs) // (4 * processes))))
+        # Los uid se numeran en cada proceso, así que se los vuelve a asignar para que no se repitan en la caché
+        for f, m in rs:
+            if f is not None: f.uid = next(filter_uids)
+        return rs
+
+    # updateFilter: Cambia algunos parámetros del filtro f (con los mismos nombres y unidades que addFilter: des y tol en
+    # %) y lo recalcula desde la primera etapa afectada (ver Filter.update). Devuelve el mensaje de error ("" si se pudo);
+    # si no se pudo, el filtro queda como estaba.
+    def updateFilter(self, f, **changes):
+        if "wp" in changes or "wa" in changes:
+            wp = copy(changes.get("wp", f.data.wp))
+            wa = copy(changes.get("wa", f.data.wa))
+            m = self.check_filter(f.type, f.approx, wp, wa, changes.get("Ap", f.data.Ap), changes.get("Aa", f.data.Aa))
+            if m != "":
+                return m
+            changes["wp"], changes["wa"] = self.check_symmetry(f.type, wp, wa)
+        if "des" in changes:
+            changes["des"] = changes["des"]/100
+        if "tol" in changes and changes["tol"] is not None:
+            changes["tol"] = changes["tol"]/100
+        self.cache.invalidate(f)
+        return f.update(**changes)
+
+    # recommend: Diseña todas las aproximaciones para la plantilla (con los mismos parámetros que addFilter) y devuelve
+    # las del frente de Pareto de orden, Q máximo y variación del retardo de grupo (ver back/recommend.py), usando los
+    # hilos del FilterSpace. Los filtros no se agregan: para quedarse con uno, addFilter con su aproximación y orden.
+    def recommend(self, filter_type, wp, wa, Ap, Aa, des=0, approxs=None, nmin=1, nmax=25, extra=3, GD=None, tol=None):
+        from back.recommend import recommend     # back/recommend.py importa este módulo
+        return recommend(filter_type, wp, wa, Ap, Aa, des, approxs, nmin, nmax, extra, GD, tol, self.get_pool())
 
     # delFilter: Saca el filtro del FilterSpace y lo destruye
     # Recibe el filtro (elemento) (Lo puedo cambiar al índice o nombre, lo que resulte más cómodo)
     def delFilter(self, f):
         self.filters.remove(f)
+        self.cache.invalidate(f)
         del f
         return
 
+    # get_cache_stats: Aciertos, fallos y tamaño de la caché de respuestas
+    def get_cache_stats(self):
+        return self.cache.stats()
+
+    # get_design_cache_stats: Aciertos y fallos de la caché de diseños (de este proceso) y lo que hay guardado
+    def get_design_cache_stats(self):
+        return self.design_cache.stats() if self.design_cache is not None else None
+
+    # get_prototype_stats: Aciertos, fallos y tamaño de la memoria de prototipos (compartida por todo el proceso)
+    def get_prototype_stats(self):
+        return prototypes.get_memo_stats()
+
+    # set_workers: Cambia la cantidad de hilos con la que se calculan las respuestas
+    def set_workers(self, workers):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        self.workers = workers
+        return
+
+    # get_pool: Devuelve el pool de hilos, o None si se trabaja con un único hilo
+    def get_pool(self):
+        if self.workers <= 1:
+            return None
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    # export_responses: Exporta la respuesta de cada filtro visible a un .npy (ver Filter.export_response).
+    # path es un formato con {name} que se reemplaza por el nombre del filtro, por ejemplo "respuestas/{name}.npy" (ver
+    # get_file_name: los nombres tienen ":" y espacios, que no van en nombres de archivo de Windows).
+    # Los filtros se exportan a la vez si hay más de un hilo. Devuelve los arreglos mapeados en el orden de los filtros.
+    def export_responses(self, path, wmin=None, wmax=None, num=1000000, chunk=65536, scale="log"):
+        fs = [f for f in self.filters if f.visibility]
+        export = lambda f: f.export_response(path.format(name=get_file_name(f.name)), wmin, wmax, num, chunk, scale)
+        pool = self.get_pool()
+        if pool is None:
+            return [export(f) for f in fs]
+        return list(pool.map(export, fs))
+
     def get_name_index(self):
-        index = None
+        return self.get_name_indexes(1)[0]
+
+    # get_name_indexes: Los primeros count índices que no usa ningún filtro (los nombres son "C<índice>: ...")
+    def get_name_indexes(self, count):
+        used = set([int(f.name[1:f.name.index(":")]) for f in self.filters])
         ixs = []
-        for i in range(len(self.filters)):
-            ixs.append(int(self.filters[i].name[1]))
-        ixs.sort()
-        for i in range(len(ixs)):
-            if ixs[i] != i:
-                index = i
-                break
-        if index is None:
-            index = len(self.filters)
-        return index
+        i = 0
+        while len(ixs) < count:
+            if i not in used:
+                ixs.append(i)
+            i = i + 1
+        return ixs
 
     def get_wminmax(self):
         wmin = []
@@ -73,12 +239,13 @@ class FilterSpace:
         wmin, wmax = self.get_wminmax()
         wmin = wmin / (2 * np.pi)
         wmax = wmax / (2 * np.pi)
-        w = np.linspace(wmin, wmax, int(100*wmax/wmin))
+        self.cache.fill([f for f in self.filters if f.visibility], "mod", self.grid, wmin, wmax, self.get_pool(), self.workers)
         cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
         ax.grid()
         for i in range(len(self.filters)):
             if self.filters[i].visibility:
-                self.filters[i].plot_mod(ax, cycle[i % len(cycle)], w, A)
+                w, mod = self.cache.get_quantity(self.filters[i], "mod", self.grid, wmin, wmax, count=False)
+                self.filters[i].plot_mod(ax, cycle[i % len(cycle)], w, A, mod=mod)
         ax.legend(loc="best")
         if not A: ax.set_title("Frequency response - Module")
         else: ax.set_title("Attenuation")
@@ -92,12 +259,13 @@ class FilterSpace:
         wmin, wmax = self.get_wminmax()
         wmin = wmin / (2 * np.pi)
         wmax = wmax / (2 * np.pi)
-        w = np.linspace(wmin, wmax, int(100*wmax/wmin))
+        self.cache.fill([f for f in self.filters if f.visibility], "ph", self.grid, wmin, wmax, self.get_pool(), self.workers)
         cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
         ax.grid()
         for i in range(len(self.filters)):
             if self.filters[i].visibility:
-                self.filters[i].plot_ph(ax, cycle[i % len(cycle)], w)
+                w, ph = self.cache.get_quantity(self.filters[i], "ph", self.grid, wmin, wmax, count=False)
+                self.filters[i].plot_ph(ax, cycle[i % len(cycle)], w, ph=ph)
         ax.legend(loc="best")
         ax.set_title("Frequency response - Phase")
         ax.set_xlabel("$f$ [Hz]")
@@ -122,12 +290,13 @@ class FilterSpace:
         wmin, wmax = self.get_wminmax()
         wmin = wmin / (2 * np.pi)
         wmax = wmax / (2 * np.pi) / 3
-        w = np.linspace(wmin, wmax, int(100 * wmax / wmin))
+        self.cache.fill([f for f in self.filters if f.visibility], "gd", self.gd_grid, wmin, wmax, self.get_pool(), self.workers)
         cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
         ax.grid()
         for i in range(len(self.filters)):
             if self.filters[i].visibility:
-                self.filters[i].plot_gd(ax, cycle[i % len(cycle)], w)
+                w, gd = self.cache.get_quantity(self.filters[i], "gd", self.gd_grid, wmin, wmax, count=False)
+                self.filters[i].plot_gd(ax, cycle[i % len(cycle)], w, gd=gd)
         ax.legend(loc="best")
         ax.set_title("Group Delay")
         ax.set_xlabel("$f$ [Hz]")
@@ -136,11 +305,12 @@ class FilterSpace:
         return
 
     # check_filter: Revisa que el filtro sea válido. Devuelve True si lo es, False si no.
-    def check_filter(self, filter_type, approx, wp, wa, Ap, Aa):
+    @staticmethod
+    def check_filter(filter_type, approx, wp, wa, Ap, Aa):
         m = ""
-        m = self.check_freq(filter_type, wp)
+        m = FilterSpace.check_freq(filter_type, wp)
         if m == "":
-            m = self.check_freq(filter_type, wa)
+            m = FilterSpace.check_freq(filter_type, wa)
         if m == "" and filter_type == FilterType.LP and not wp < wa:
             m = "El orden de las frecuencias de atenuación y paso no corresponde al de un filtro pasa bajos"
         if m == "" and filter_type == FilterType.HP and not wa < wp:
@@ -158,7 +328,8 @@ class FilterSpace:
         return m
 
     # check_freq: Revisa que el formato de la frecuencia sea consistente con el tipo.
-    def check_freq(self, filter_type, w):
+    @staticmethod
+    def check_freq(filter_type, w):
         m = ""
         try:
             len_w = len(w)
@@ -170,7 +341,8 @@ class FilterSpace:
             m = "ERROR: Las frecuencias de paso o atenuación ingresadas no son un arreglo"
         return m
 
-    def check_symmetry(self, filter_type, wp, wa):
+    @staticmethod
+    def check_symmetry(filter_type, wp, wa):
         if filter_type == FilterType.BP:
             if wp[0] * wp[1] <= wa[0] * wa[1]:
                 wa[1] = (wp[0] * wp[1]) / wa[0]
@@ -183,6 +355,106 @@ class FilterSpace:
                 wp[0] = (wa[0] * wa[1]) / wp[1]
         return wp, wa
 
+# Resultado del diseño de una plantilla (ver design_filter):
+# - filter: Filtro creado (None si la plantilla no pasó check_filter; si falló al calcularlo es de tipo FilterType.ERR)
+# - message: Mensaje de error ("" si se creó el filtro)
+DesignResult = namedtuple("DesignResult", ["filter", "message"])
+
+# Argumentos de addFilter, en orden, con sus valores por defecto
+spec_fields = ["filter_type", "approx", "wp", "wa", "Ap", "Aa", "des", "G", "n", "Q", "nmin", "nmax", "Qmax", "rp", "GD", "tol"]
+spec_defaults = {"G": 1, "n": None, "Q": None, "nmin": None, "nmax": None, "Qmax": None, "rp": None, "GD": None, "tol": None}
+
+# get_file_name: Nombre del filtro apto para usar en un nombre de archivo (cualquier carácter que no sea letra, número,
+# punto o guión pasa a "_")
+def get_file_name(name):
+    return re.sub(r"[^\w.-]+", "_", name).strip("_")
+
+
+# get_spec_args: Argumentos de addFilter (diccionario) a partir de una plantilla, que puede ser:
+# - Una tupla o lista con los argumentos en el orden de addFilter
+# - Un diccionario con los nombres de los argumentos de addFilter
+# - Una fila de un arreglo estructurado con esos nombres como campos (wp y wa de 2 elementos para pasa banda y
+#   rechaza banda). Los campos opcionales que valen nan se toman como None (así que n, nmin y nmax pueden ser campos
+#   float: los que no son nan pasan a int).
+def get_spec_args(spec):
+    if isinstance(spec, np.void):
+        spec = {name: spec[name] for name in spec.dtype.names}
+    elif not isinstance(spec, dict):
+        spec = dict(zip(spec_fields, spec))
+    args = dict(spec_defaults)
+    for name, value in spec.items():
+        if isinstance(value, (np.ndarray, np.generic)):
+            value = value.tolist()
+        if isinstance(value, tuple):
+            value = list(value)
+        if name in spec_defaults and isinstance(value, float) and np.isnan(value):
+            value = None
+        if name in ["n", "nmin", "nmax"] and value is not None:
+            value = int(value)
+        args[name] = value
+    return args
+
+# design_filter: Diseña el filtro de una plantilla (ver get_spec_args) igual que addFilter, pero sin agregarlo a ningún
+# FilterSpace. Como es una función del módulo, se la puede mandar a otros procesos. Devuelve un DesignResult.
+# Si se pasa una DesignCache y la plantilla ya estaba guardada, el filtro se arma con lo guardado (ver restore_filter);
+# si no, se lo diseña y se lo guarda.
+def design_filter(spec, cache=None):
+    a = get_spec_args(spec)
+    m = FilterSpace.check_filter(a["filter_type"], a["approx"], a["wp"], a["wa"], a["Ap"], a["Aa"])
+    if m != "":
+        return DesignResult(None, m)
+    key = get_key(a) if cache is not None else None
+    entry = cache.get(key) if cache is not None else None
+    wp, wa = FilterSpace.check_symmetry(a["filter_type"], a["wp"], a["wa"])
+    if entry is not None:
+        return DesignResult(restore_filter(a, wp, wa, entry), "")
+    f = switch_atypes.get(a["approx"])(a["filter_type"], wp, wa, a["Ap"], a["Aa"], a["des"]/100, a["G"], a["n"], a["Q"],
+                                       a["nmin"], a["nmax"], a["Qmax"], a["rp"], a["GD"], a["tol"])
+    if f.type == FilterType.ERR:
+        return DesignResult(f, f.error)
+    if cache is not None:
+        cache.put(key, f)
+    return DesignResult(f, "")
+
+# design_spec: Igual que design_filter, pero si el diseño lanza una excepción la devuelve como mensaje del
+# DesignResult, para que una plantilla que falla no haga perder las demás de design_many
+def design_spec(spec, cache=None):
+    try:
+        return design_filter(spec, cache)
+    except DesignCancelled:
+        raise
+    except Exception as e:
+        return DesignResult(None, str(e))
+
+# run_cancellable: Corre fn(*args) con event como evento de cancelación del contexto (ver FilterClass.cancel_event)
+def run_cancellable(event, fn, *args):
+    token = cancel_event.set(event)
+    try:
+        check_cancelled()
+        return fn(*args)
+    finally:
+        cancel_event.reset(token)
+
+# restore_filter: Arma el filtro de la plantilla (argumentos a, frecuencias ya simetrizadas) con un diseño guardado en
+# una DesignCache, sin buscar el orden ni calcular los ceros y polos
+def restore_filter(a, wp, wa, entry):
+    none = lambda x: None if np.isnan(x) else float(x)
+    cls = approx_classes[a["approx"]]
+    f = cls.__new__(cls)
+    f.init_data(a["filter_type"], ApproxType(a["approx"]), FilterData(wp, wa, a["Ap"], a["Aa"], a["des"]/100, a["G"]),
+                none(entry["rp"]), none(entry["GD"]), none(entry["tol"]))
+    f.zeros, f.poles, f.data.g = entry["zeros"], entry["poles"], float(entry["g"])
+    f.data.n = int(entry["n"])
+    f.data.Q = none(entry["Q"])
+    if a["Qmax"] is not None:
+        f.q_search = QSearchResult(True, f.data.n, f.data.Q, "")
+    # Los mismos parámetros de diseño que recibe el constructor en switch_atypes (los usa Filter.update)
+    f.args = {"n": a["n"], "Q": a["Q"], "nmin": a["nmin"], "nmax": a["nmax"], "Qmax": a["Qmax"],
+              "rp": a["rp"] if a["approx"] == ApproxType.CH1 else None, "GD": a["GD"],
+              "tol": a["tol"]/100 if a["tol"] is not None and a["approx"] in [ApproxType.B, ApproxType.G] else None}
+    f.build_outputs()
+    return f
+
 def butterworth(filter_type, wp, wa, Ap, Aa, des, G, n, Q, nmin, nmax, Qmax, rp, GD, tol):
     data = FilterData(wp, wa, Ap, Aa, des, G)
     f = Butterworth(filter_type, data, n, Q, nmin, nmax, Qmax, GD)
@@ -218,6 +490,10 @@ def gauss(filter_type, wp, wa, Ap, Aa, des, G, n, Q, nmin, nmax, Qmax, rp, GD, t
     f = Gauss(filter_type, data, n, Q, nmin, nmax, Qmax, GD, tol/100 if tol is not None else None)
     return f
 
+# Clase de cada aproximación
+approx_classes = {ApproxType.BW: Butterworth, ApproxType.CH1: ChebyI, ApproxType.CH2: ChebyII, ApproxType.LG: Legendre,
+                  ApproxType.C: Cauer, ApproxType.B: Bessel, ApproxType.G: Gauss}
+
 # SWITCH
 switch_atypes = {
     0: butterworth,
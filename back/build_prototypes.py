@@ -0,0 +1,55 @@
+import sys
+import warnings
+import numpy as np
+from back.FilterClass import FilterData, FilterType, ApproxType
+from back.backend import approx_classes
+from back import prototypes
+
+# Arma la biblioteca de prototipos de back/prototypes.py:
+#   python -m back.build_prototypes [archivo]
+# Cada prototipo sale del mismo get_fun que se usa al diseñar, así que buscarlo en la tabla da lo mismo que calcularlo.
+
+
+# get_param_grid: Parámetros (p1, p2) a tabular para cada aproximación
+def get_param_grid(approx):
+    if approx in [ApproxType.BW, ApproxType.CH1, ApproxType.LG]:
+        return [(Ap, 0) for Ap in prototypes.AP_GRID]
+    elif approx == ApproxType.CH2:
+        return [(0, Aa) for Aa in prototypes.AA_GRID]
+    elif approx == ApproxType.C:
+        return [(Ap, Aa) for Ap in prototypes.AP_GRID for Aa in prototypes.AA_GRID]
+    return [(0, 0)]
+
+
+# get_prototype_filter: Filtro sin calcular (sólo con los datos que usa get_fun) para los parámetros p1, p2
+def get_prototype_filter(approx, p1, p2):
+    f = approx_classes[approx].__new__(approx_classes[approx])
+    f.type = FilterType.GD if approx == ApproxType.B else FilterType.LP
+    f.approx = approx
+    f.data = FilterData(1, 2, p1 if p1 else 1, p2 if p2 else 40, 0, 1)
+    f.data.eps = f.get_eps(f.data.Ap)
+    f.data.rp = p1 if approx == ApproxType.CH1 else None
+    return f
+
+
+def build(path=prototypes.default_path):
+    protos = []
+    for approx in approx_classes:
+        for p1, p2 in get_param_grid(approx):
+            f = get_prototype_filter(approx, p1, p2)
+            for n in range(1, prototypes.NMAX + 1):
+                try:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        z, p, k = f.get_normalized_fun(n)
+                except Exception:
+                    continue
+                if np.all(np.isfinite(p)) and np.all(np.isfinite(z)) and np.isfinite(k):
+                    protos.append((approx, n, p1, p2, z, p, k))
+    prototypes.save(path, protos)
+    return len(protos)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else prototypes.default_path
+    print(build(path), "prototipos guardados en", path)
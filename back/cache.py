@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from threading import RLock
+from back.response import batch_response, batch_group_delay
+
+# LRUCache: Diccionario acotado a maxsize elementos. Cuando se llena descarta el que se usó hace más tiempo.
+# Lleva la cuenta de aciertos (hits) y fallos (misses) de get.
+# Se puede usar desde varios hilos a la vez (cada operación toma el lock).
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = RLock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    # get: Devuelve el valor guardado para key (y lo marca como el más reciente), o default si no está
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    # peek: Igual que get pero sin contar aciertos ni fallos (para releer lo que ya se contó)
+    def peek(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                return self.data[key]
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+        return
+
+    # remove: Saca todos los elementos cuya clave cumple con cond
+    def remove(self, cond):
+        with self.lock:
+            for key in [key for key in self.data if cond(key)]:
+                del self.data[key]
+        return
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = 0
+            self.misses = 0
+        return
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.data), "maxsize": self.maxsize}
+
+
+# ResponseCache: Caché de respuestas en frecuencia ya calculadas.
+# Las claves son (uid del filtro, clave de la grilla, magnitud), con magnitud:
+# - "mod": Módulo [dB]
+# - "ph": Fase [°]
+# - "gd": Retardo de grupo (normalizado como en Filter.get_GD)
+# Como módulo y fase salen de la misma evaluación, un fallo en cualquiera de los dos guarda ambos.
+# La atenuación se obtiene del módulo, así que pasar de un gráfico a otro no recalcula nada.
+class ResponseCache(LRUCache):
+    # get_quantity: Devuelve (w, valores) de la magnitud pedida para el filtro f en la grilla grid entre wmin y wmax.
+    # Después de fill, que ya contó el acierto o el fallo, se pasa count=False para no contarlo dos veces (si aun así
+    # no está, por ejemplo porque se lo descartó, se cuenta el fallo).
+    def get_quantity(self, f, quantity, grid, wmin, wmax, count=True):
+        key = (f.uid, grid.key(wmin, wmax))
+        r = None if count else self.peek(key + (quantity,))
+        if r is None:
+            r = self.get(key + (quantity,))
+        if r is None:
+            r = self.compute_quantity(f, quantity, grid, wmin, wmax)
+        return r
+
+    # compute_quantity: Calcula la magnitud pedida para el filtro f (en su propia grilla) y la guarda, sin contar nada
+    def compute_quantity(self, f, quantity, grid, wmin, wmax):
+        key = (f.uid, grid.key(wmin, wmax))
+        w = grid.get(wmin, wmax, f)
+        if quantity == "gd":
+            r = f.get_GD(w)
+            self.put(key + ("gd",), r)
+        else:
+            w, mod, ph, gd = f.get_response(w)
+            self.put(key + ("mod",), (w, mod))
+            self.put(key + ("ph",), (w, ph))
+            r = (w, mod) if quantity == "mod" else (w, ph)
+        return r
+
+    # fill: Calcula de una sola vez (con batch_response) todo lo que falte de la magnitud pedida para los filtros fs.
+    # Cada filtro cuenta como un acierto si ya estaba y como un fallo si no, así que después se lo lee con
+    # get_quantity(..., count=False). Con la grilla adaptiva cada filtro tiene la suya y se calculan por separado.
+    # Si se pasa un pool de hilos (concurrent.futures), los filtros se reparten en parts grupos de costo parecido que
+    # se calculan a la vez: NumPy suelta el GIL durante las cuentas, así que los hilos corren en paralelo.
+    def fill(self, fs, quantity, grid, wmin, wmax, pool=None, parts=1):
+        key = grid.key(wmin, wmax)
+        with self.lock:
+            missing = [f for f in fs if (f.uid, key, quantity) not in self.data]
+            self.hits += len(fs) - len(missing)
+            self.misses += len(missing)
+        fs = missing
+        if len(fs) == 0:
+            return
+        if grid.scale == "adaptive":
+            if pool is not None:
+                list(pool.map(lambda f: self.compute_quantity(f, quantity, grid, wmin, wmax), fs))
+            else:
+                for f in fs:
+                    self.compute_quantity(f, quantity, grid, wmin, wmax)
+            return
+        w = grid.get(wmin, wmax)
+        if pool is not None and parts > 1 and len(fs) > 1:
+            # Repartidos de forma intercalada según el orden, para que todos los grupos tengan un costo similar
+            fs.sort(key=lambda f: len(f.poles))
+            list(pool.map(lambda group: self.compute(group, quantity, w, key), [fs[i::parts] for i in range(parts)]))
+        else:
+            self.compute(fs, quantity, w, key)
+        return
+
+    # compute: Calcula la magnitud pedida para los filtros fs sobre el arreglo w y la guarda con la clave de grilla key
+    def compute(self, fs, quantity, w, key):
+        if len(fs) == 0:
+            return
+        if quantity == "gd":
+            gd = batch_group_delay([f.zeros for f in fs], [f.poles for f in fs], w)
+            for i, f in enumerate(fs):
+                self.put((f.uid, key, "gd"), (w, f.normalize_GD(gd[i])))
+        else:
+            w, mod, ph, gd = batch_response([f.zeros for f in fs], [f.poles for f in fs], [f.data.g for f in fs], w)
+            for i, f in enumerate(fs):
+                self.put((f.uid, key, "mod"), (w, mod[i]))
+                self.put((f.uid, key, "ph"), (w, ph[i]))
+        return
+
+    # invalidate: Descarta todo lo guardado para el filtro f (cuando se borra o se vuelve a calcular)
+    def invalidate(self, f):
+        self.remove(lambda key: key[0] == f.uid)
+        return
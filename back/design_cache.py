@@ -0,0 +1,158 @@
+import os
+import json
+import tempfile
+import hashlib
+import numpy as np
+from back import prototypes
+
+# Caché en disco de filtros ya diseñados, para no repetir la búsqueda de orden, get_zpk y denormalize cuando se vuelve a
+# pedir la misma plantilla (en otra sesión de la interfaz, en los scripts de regresión, etc.).
+# Cada diseño se guarda en un .npz propio en path/<versión>/<2 primeros caracteres de la clave>/<clave>.npz, con:
+# - zeros, poles, g: Ceros, polos y ganancia ya desnormalizados (con la ganancia G incluida)
+# - n, Q: Orden y Q máximo
+# - rp, GD, tol: Los datos que completa el diseño cuando no se pasan (nan si quedaron en None)
+# La clave es el hash de los argumentos de addFilter (ver get_key) y la versión es el hash del código que diseña los
+# filtros (ver get_version), así que cualquier cambio en una aproximación deja sin efecto lo guardado.
+# Cuando se superan max_entries archivos o max_bytes bytes se borran los que se usaron hace más tiempo (cada lectura
+# actualiza la fecha de modificación del archivo). Los de otras versiones se borran antes que ninguno.
+# Los archivos se escriben en uno temporal (con nombre único, ver put) y se renombran, así que se puede usar la misma
+# carpeta desde varios procesos e hilos a la vez.
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "design_cache")
+
+# Archivos cuyo código define el diseño de los filtros
+source_files = ["FilterClass.py", "backend.py", "response.py", "prototypes.py", "stage_handler.py"]
+
+version = None  # Versión del código (se calcula la primera vez que hace falta)
+
+
+# get_version: Hash del código de source_files, de todas las aproximaciones de back/Approx y del código con el que se
+# armó la biblioteca de prototipos (ver prototypes.get_source_hash)
+def get_version():
+    global version
+    if version is None:
+        back = os.path.dirname(os.path.abspath(__file__))
+        approx = os.path.join(back, "Approx")
+        files = [os.path.join(back, f) for f in source_files]
+        files = files + sorted([os.path.join(approx, f) for f in os.listdir(approx) if f.endswith(".py")])
+        h = hashlib.sha1()
+        for file in files:
+            with open(file, "rb") as f:
+                h.update(f.read())
+        h.update(prototypes.get_source_hash().encode())
+        version = h.hexdigest()[:16]
+    return version
+
+
+# get_key: Hash de la forma canónica de los argumentos de addFilter (diccionario de get_spec_args): los números pasan a
+# float, los arreglos a listas y los campos van siempre en el mismo orden
+def get_key(args):
+    def canonical(value):
+        if value is None:
+            return None
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return [canonical(v) for v in value]
+        return float(value)
+    text = json.dumps([[name, canonical(args[name])] for name in sorted(args)])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class DesignCache:
+    def __init__(self, path=default_path, max_entries=10000, max_bytes=64 * 1024 * 1024, prune_every=64):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every  # Cada cuántas escrituras se revisan los límites
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    # get_file: Archivo del diseño con clave key
+    def get_file(self, key):
+        return os.path.join(self.path, get_version(), key[:2], key + ".npz")
+
+    # get: Devuelve el diseño guardado (diccionario con los campos de arriba) para la clave key, o None si no está
+    def get(self, key):
+        file = self.get_file(key)
+        try:
+            with np.load(file) as data:
+                entry = {name: data[name] for name in data.files}
+            os.utime(file)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    # put: Guarda el diseño del filtro f con la clave key. Si no se lo puede escribir (disco lleno, permisos, etc.) no
+    # se lo guarda y listo: la caché es sólo una ayuda, así que eso no hace fallar el diseño.
+    def put(self, key, f):
+        file = self.get_file(key)
+        none = lambda x: np.nan if x is None else x
+        tmp = None
+        try:
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(file))
+            with os.fdopen(fd, "wb") as out:
+                np.savez(out, zeros=np.asarray(f.zeros), poles=np.asarray(f.poles),
+                         g=f.data.g, n=f.data.n, Q=none(f.data.Q), rp=none(f.data.rp), GD=none(f.data.GD), tol=none(f.data.tol))
+            os.replace(tmp, file)
+        except OSError:
+            if tmp is not None and os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            return
+        self.puts += 1
+        if self.puts % self.prune_every == 0:
+            self.prune()
+        return
+
+    # get_files: Lista de (archivo, versión, tamaño, fecha de modificación) de todos los diseños guardados
+    def get_files(self):
+        files = []
+        for root, dirs, names in os.walk(self.path):
+            for name in names:
+                if name.endswith(".npz"):
+                    file = os.path.join(root, name)
+                    try:
+                        st = os.stat(file)
+                    except OSError:
+                        continue
+                    files.append((file, os.path.relpath(file, self.path).split(os.sep)[0], st.st_size, st.st_mtime))
+        return files
+
+    # prune: Borra los diseños de otras versiones y, si se superan los límites, los usados hace más tiempo
+    def prune(self):
+        files = self.get_files()
+        # Primero los de otras versiones, después del más viejo al más nuevo
+        files.sort(key=lambda x: (x[1] == get_version(), x[3]))
+        count = len(files)
+        size = sum([x[2] for x in files])
+        for file, v, fsize, mtime in files:
+            if v == get_version() and count <= self.max_entries and size <= self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            count = count - 1
+            size = size - fsize
+        return
+
+    def clear(self):
+        for file, v, fsize, mtime in self.get_files():
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+        self.hits = 0
+        self.misses = 0
+        return
+
+    # stats: Aciertos y fallos de este proceso, y cantidad y tamaño de los diseños guardados
+    def stats(self):
+        files = self.get_files()
+        return {"hits": self.hits, "misses": self.misses, "entries": len(files), "bytes": sum([x[2] for x in files]),
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes}
@@ -0,0 +1,114 @@
+import numpy as np
+from back.response import zpk_response
+
+# FreqGrid: Política para armar los arreglos de frecuencia de los gráficos.
+# La cantidad de puntos depende de las décadas que abarca el rango y no del cociente wmax/wmin.
+# Parámetros:
+# - points_per_decade: Puntos por década
+# - max_points: Máxima cantidad de puntos (y mínima 2)
+# - scale: "log" (puntos equiespaciados en escala logarítmica), "lin" (equiespaciados en escala lineal) o
+#          "adaptive" (se refina alrededor de resonancias y ceros de transmisión, ver adaptive_response)
+class FreqGrid:
+    def __init__(self, points_per_decade=200, max_points=4000, scale="log"):
+        self.points_per_decade = points_per_decade
+        self.max_points = max_points
+        self.scale = scale
+
+    # get_num: Cantidad de puntos para el rango [wmin, wmax]
+    def get_num(self, wmin, wmax):
+        decades = np.log10(wmax / wmin)
+        num = int(np.ceil(decades * self.points_per_decade)) + 1
+        return min(max(num, 2), self.max_points)
+
+    # get: Devuelve el arreglo de frecuencias para el rango [wmin, wmax]
+    # Con la escala "adaptive" hace falta el filtro f; sin él se usa la escala logarítmica.
+    def get(self, wmin, wmax, f=None):
+        num = self.get_num(wmin, wmax)
+        if self.scale == "adaptive" and f is not None:
+            w = f.get_adaptive_response(wmin, wmax, num)[0]
+        elif self.scale == "lin":
+            w = np.linspace(wmin, wmax, num)
+        else:
+            w = np.geomspace(wmin, wmax, num)
+        return w
+
+    # key: Identifica unívocamente al arreglo que devuelve get (sirve para cachear resultados)
+    def key(self, wmin, wmax):
+        return self.scale, self.get_num(wmin, wmax), float(wmin), float(wmax)
+
+
+# get_seeds: Frecuencias donde conviene tener puntos de entrada: ceros sobre el eje jw (notches) y polos de Q alto.
+# Alrededor de cada una se agregan puntos a ambos lados, más juntos cuanto más selectiva es la singularidad.
+# La frecuencia de un cero sobre el eje no se agrega: ahí el módulo es -inf dB y matplotlib descarta el punto.
+def get_seeds(z, p, wmin, wmax, Qmin=2):
+    seeds = []
+    for root in np.concatenate([np.atleast_1d(z), np.atleast_1d(p)]).astype(complex):
+        wo = abs(root)
+        if wo == 0:
+            continue
+        if root.real == 0:
+            delta = np.array([1E-4, 1E-3, 1E-2])
+            seeds.extend([*(wo * (1 + delta)), *(wo / (1 + delta))])
+            continue
+        else:
+            Q = wo / (2 * abs(root.real))
+            if Q < Qmin:
+                continue
+            delta = np.array([1 / (8 * Q), 1 / (2 * Q), 2 / Q])
+        seeds.extend([wo, *(wo * (1 + delta)), *(wo / (1 + delta))])
+    seeds = np.array(seeds)
+    return seeds[(seeds > wmin) & (seeds < wmax)]
+
+
+# adaptive_response: Evalúa la transferencia con una grilla adaptiva.
+# Arranca con una grilla logarítmica gruesa (más los puntos de get_seeds) y en cada pasada parte a la mitad los
+# intervalos donde el punto del medio se aleja de la interpolación lineal de sus vecinos más que la tolerancia
+# (curvatura del módulo o de la fase), hasta que ninguno la supera o se agota el presupuesto de puntos.
+# Recibe: - z, p, k: ceros, polos y ganancia
+#         - wmin, wmax: rango de frecuencias
+#         - budget: máxima cantidad de evaluaciones
+#         - tol: tolerancia para el módulo [dB] y para la fase [°]
+#         - coarse: puntos de la grilla inicial
+# Devuelve: w, módulo [dB], fase [°] y retardo de grupo, igual que zpk_response
+def adaptive_response(z, p, k, wmin, wmax, budget=400, tol=(0.5, 5.0), coarse=32):
+    x = np.linspace(np.log10(wmin), np.log10(wmax), min(coarse, budget))
+    seeds = get_seeds(z, p, wmin, wmax)
+    if len(seeds) > 0:
+        x = np.union1d(x, np.log10(seeds)[:max(budget - len(x), 0)])
+    w, mod, ph, gd = zpk_response(z, p, k, 10 ** x)
+    tol = np.array(tol)[:, np.newaxis]
+    xmin = (x[-1] - x[0]) * 1E-6
+
+    while len(x) < budget:
+        # Lo que queda 100 dB por debajo del máximo no se ve, así que no se sigue refinando el fondo de los notches,
+        # ni tampoco el salto de fase que tienen justo ahí
+        floor = np.max(mod) - 100
+        y = np.vstack([np.clip(mod, floor, None), ph])
+        ylin = y[:, :-2] + (y[:, 2:] - y[:, :-2]) * (x[1:-1] - x[:-2]) / (x[2:] - x[:-2])
+        err = np.abs(y[:, 1:-1] - ylin) / tol
+        deep = (y[0, :-2] <= floor) | (y[0, 1:-1] <= floor) | (y[0, 2:] <= floor)
+        err[1, deep] = 0
+        err = np.max(err, axis=0)
+        err_int = np.zeros(len(x) - 1)
+        err_int[:-1] = err
+        err_int[1:] = np.maximum(err_int[1:], err)
+        err_int[np.diff(x) < xmin] = 0
+        ixs = np.flatnonzero(err_int > 1)
+        if len(ixs) == 0:
+            break
+        ixs = ixs[np.argsort(-err_int[ixs])][:budget - len(x)]
+        xn = (x[ixs] + x[ixs + 1]) / 2
+        wn, modn, phn, gdn = zpk_response(z, p, k, 10 ** xn)
+        order = np.argsort(np.concatenate([x, xn]))
+        x = np.concatenate([x, xn])[order]
+        w = np.concatenate([w, wn])[order]
+        mod = np.concatenate([mod, modn])[order]
+        gd = np.concatenate([gd, gdn])[order]
+        # Cada tanda se desenrolla por separado, así que se vuelve a desenrollar todo junto
+        ph = np.degrees(np.unwrap(np.radians(np.concatenate([ph, phn])[order])))
+
+    return w, mod, ph, gd
+
+
+default_grid = FreqGrid()
+default_lin_grid = FreqGrid(scale="lin")
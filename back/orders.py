@@ -0,0 +1,196 @@
+import numpy as np
+import scipy.signal as ss
+import numpy.polynomial.legendre as leg
+from scipy.special import ellipk, ellipkm1, factorial
+from back.FilterClass import FilterType, ApproxType
+from back.response import group_delay
+from back.Approx.legendre import get_ln_coefs
+from back.Approx.gauss import get_gauss_poles
+from back.Approx.bessel import get_bessel_coefs, bessel_delay
+from back import prototypes
+
+# Selección de orden para muchas plantillas a la vez, sin crear los filtros.
+# Cada función recibe arreglos de N plantillas (wp y wa de N elementos, o de N x 2 para pasa banda y rechaza banda;
+# Ap, Aa, GD y tol de N elementos o escalares) y devuelve un arreglo de N órdenes, el mismo n con el que quedaría
+# cada Filter antes de la restricción de Qmax (get_best_n más el recorte a [nmin, nmax] de get_n).
+# Las frecuencias se simetrizan igual que en FilterSpace.check_symmetry. Las plantillas inválidas dan -1.
+
+
+# get_orders: Orden de cada plantilla para la aproximación approx y el tipo de filtro filter_type
+def get_orders(approx, filter_type, wp, wa, Ap, Aa, nmin=None, nmax=None, GD=None, tol=None):
+    wp, wa = get_symmetric(filter_type, np.array(wp, dtype=float), np.array(wa, dtype=float))
+    size = len(wp)
+    Ap = np.broadcast_to(np.asarray(Ap, dtype=float), (size,))
+    Aa = np.broadcast_to(np.asarray(Aa, dtype=float), (size,))
+    if approx in [ApproxType.BW, ApproxType.CH1, ApproxType.CH2, ApproxType.C]:
+        n = get_closed_form_orders(approx, filter_type, wp, wa, Ap, Aa)
+        if nmin is not None: n = np.where((n >= 0) & (n < nmin), nmin, n)
+        if nmax is not None: n = np.where(n > nmax, nmax, n)
+        return n
+
+    # Las aproximaciones iterativas recorren n = nmin, ..., nmax - 1 hasta el primero que cumple (o se quedan con nmax)
+    nmin = 1 if nmin is None else nmin
+    nmax = prototypes.NMAX if nmax is None else nmax
+    if filter_type == FilterType.GD:
+        GD = np.broadcast_to(np.asarray(1E-3 if GD is None else GD, dtype=float), (size,))
+        tol = np.broadcast_to(np.asarray(0.1 if tol is None else tol, dtype=float), (size,))
+    wan = get_wan(filter_type, wp, wa, GD)
+    ns = np.arange(nmin, nmax)
+    if approx == ApproxType.LG:
+        ok = legendre_check(ns, wan, Ap, Aa)
+    elif approx == ApproxType.G and filter_type == FilterType.GD:
+        ok = gauss_delay_check(ns, wan, tol)
+    elif approx == ApproxType.G:
+        ok = gauss_check(ns, wan, Ap, Aa)
+    elif approx == ApproxType.B and filter_type == FilterType.GD:
+        ok = bessel_delay_check(ns, wan, tol)
+    elif approx == ApproxType.B:
+        ok = bessel_check(ns, wan, Ap, Aa)
+    else:
+        return np.full(size, -1)
+    # Primer orden que cumple de cada plantilla (argmax devuelve el primer True), o nmax si ninguno cumple
+    n = np.where(ok.any(axis=1), nmin + np.argmax(ok, axis=1), nmax) if len(ns) > 0 else np.full(size, nmin)
+    return np.where(np.isfinite(wan), n, -1)
+
+
+# get_lowest_orders: Calcula los órdenes de todas las aproximaciones de approxs y devuelve, para cada plantilla,
+# la aproximación de menor orden (la primera de approxs en caso de empate) y ese orden.
+def get_lowest_orders(filter_type, wp, wa, Ap, Aa, approxs=None, nmin=None, nmax=None, GD=None, tol=None):
+    if approxs is None:
+        if filter_type == FilterType.GD: approxs = [ApproxType.B, ApproxType.G]
+        else: approxs = list(ApproxType)
+    orders = np.array([get_orders(approx, filter_type, wp, wa, Ap, Aa, nmin, nmax, GD, tol) for approx in approxs])
+    orders = np.where(orders < 0, np.iinfo(orders.dtype).max, orders)
+    best = np.argmin(orders, axis=0)
+    return np.array(approxs)[best], orders[best, np.arange(orders.shape[1])]
+
+
+# get_symmetric: Igual que FilterSpace.check_symmetry, para N plantillas
+def get_symmetric(filter_type, wp, wa):
+    wp = np.atleast_1d(wp)
+    wa = np.atleast_1d(wa)
+    if filter_type == FilterType.BP:
+        cond = wp[:, 0] * wp[:, 1] <= wa[:, 0] * wa[:, 1]
+        wa[cond, 1] = (wp[cond, 0] * wp[cond, 1]) / wa[cond, 0]
+        wa[~cond, 0] = (wp[~cond, 0] * wp[~cond, 1]) / wa[~cond, 1]
+    elif filter_type == FilterType.BR:
+        cond = wa[:, 0] * wa[:, 1] <= wp[:, 0] * wp[:, 1]
+        wp[cond, 1] = (wa[cond, 0] * wa[cond, 1]) / wp[cond, 0]
+        wp[~cond, 0] = (wa[~cond, 0] * wa[~cond, 1]) / wp[~cond, 1]
+    return wp, wa
+
+
+# get_wan: Igual que Filter.get_wan, para N plantillas
+def get_wan(filter_type, wp, wa, GD=None):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if filter_type == FilterType.LP:
+            return wa / wp
+        elif filter_type == FilterType.HP:
+            return wp / wa
+        elif filter_type == FilterType.BP:
+            return (wa[:, 1] - wa[:, 0]) / (wp[:, 1] - wp[:, 0])
+        elif filter_type == FilterType.BR:
+            return (wp[:, 1] - wp[:, 0]) / (wa[:, 1] - wa[:, 0])
+        elif filter_type == FilterType.GD:
+            return wp * GD
+    return np.full(len(wp), np.nan)
+
+
+# get_closed_form_orders: Las mismas cuentas que ss.buttord, ss.cheb1ord, ss.cheb2ord y ss.ellipord (analógicos),
+# hechas sobre todos los arreglos a la vez. Para rechaza banda esas funciones optimizan los bordes de la banda de paso
+# con fminbound, así que ahí se las llama plantilla por plantilla.
+def get_closed_form_orders(approx, filter_type, wp, wa, Ap, Aa):
+    n = np.full(len(wp), -1)
+    if filter_type == FilterType.BR:
+        ordfun = {ApproxType.BW: ss.buttord, ApproxType.CH1: ss.cheb1ord, ApproxType.CH2: ss.cheb2ord, ApproxType.C: ss.ellipord}[approx]
+        for i in range(len(wp)):
+            try:
+                n[i] = ordfun(wp[i], wa[i], Ap[i], Aa[i], True)[0]
+            except (ValueError, ZeroDivisionError, OverflowError):
+                pass
+        return n
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        if filter_type == FilterType.LP:
+            nat = wa / wp
+        elif filter_type == FilterType.HP:
+            nat = wp / wa
+        elif filter_type == FilterType.BP:
+            nat = np.min(np.abs((wa ** 2 - (wp[:, 0] * wp[:, 1])[:, np.newaxis]) / (wa * (wp[:, 0] - wp[:, 1])[:, np.newaxis])), axis=1)
+        else:
+            return n
+
+        GSTOP = 10 ** (0.1 * np.abs(Aa))
+        GPASS = 10 ** (0.1 * np.abs(Ap))
+        if approx == ApproxType.BW:
+            order = np.ceil(np.log10((GSTOP - 1.0) / (GPASS - 1.0)) / (2 * np.log10(nat)))
+        elif approx in [ApproxType.CH1, ApproxType.CH2]:
+            order = np.ceil(np.arccosh(np.sqrt((GSTOP - 1.0) / (GPASS - 1.0))) / np.arccosh(nat))
+        else:
+            arg1_sq = np.expm1(np.log(10) * 0.1 * Ap) / np.expm1(np.log(10) * 0.1 * Aa)
+            arg0 = 1.0 / nat
+            order = np.ceil(ellipk(arg0 ** 2) * ellipkm1(arg1_sq) / (ellipkm1(arg0 ** 2) * ellipk(arg1_sq)))
+    valid = np.isfinite(order) & (order >= 0)
+    n[valid] = order[valid]
+    return n
+
+
+# Chequeos de cada aproximación iterativa (los mismos que hace su get_best_n), para los órdenes ns y las N plantillas.
+# Devuelven una matriz de N x len(ns) que indica qué órdenes cumplen. Se usan las expresiones analíticas del módulo o
+# del retardo y las tablas de prototipos de cada aproximación, sin calcular filtros.
+
+# legendre_check: |H(jw)|^2 = 1 / (1 + eps^2 F(2w^4 - 1)) en w = 1 y w = wan
+def legendre_check(ns, wan, Ap, Aa):
+    eps2 = np.power(10, Ap / 10) - 1
+    w = np.stack([np.minimum(1, wan), np.maximum(1, wan)])
+    u = 2 * np.power(w, 4) - 1
+    ok = np.zeros((len(wan), len(ns)), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for j, n in enumerate(ns.tolist()):
+            A = 10 * np.log10(1 + eps2 * leg.legval(u, get_ln_coefs(n)))
+            ok[:, j] = (-A[0] >= -Ap * 1.0001) & (-A[1] <= -Aa * 0.9999)
+    return ok
+
+
+# gauss_check: |H(jw)|^2 = 1 / P(w^2), con P la exponencial truncada, en w = 1 y w = wan
+def gauss_check(ns, wan, Ap, Aa):
+    w = np.stack([np.minimum(1, wan), np.maximum(1, wan)])
+    k = np.arange(ns[-1] + 1)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        A = 10 * np.log10(np.cumsum(np.power(w[:, :, np.newaxis], 2 * k) / factorial(k), axis=2))[:, :, ns]
+    return (np.around(-A[0]) >= -Ap[:, np.newaxis]) & (np.around(-A[1]) <= -Aa[:, np.newaxis])
+
+
+# gauss_delay_check: Retardo en wpn contra el retardo en wpn/10, con los polos de la tabla de prototipos
+def gauss_delay_check(ns, wpn, tol):
+    ok = np.zeros((len(wpn), len(ns)), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for j, n in enumerate(ns.tolist()):
+            p = get_gauss_poles(n)[0]
+            gd0 = group_delay([], p, wpn / 10)
+            gd1 = group_delay([], p, wpn)
+            ok[:, j] = (gd1 >= (1 - tol) * gd0) & ~np.isnan(gd1)
+    return ok
+
+
+# bessel_check: El prototipo de get_fun es el normalizado en retardo escalado en 1/wan, así que el módulo en w es el
+# del normalizado en w*wan: |H(jw)| = D(0) / |D(jw)|, con D el polinomio de Bessel inverso
+def bessel_check(ns, wan, Ap, Aa):
+    w = np.stack([np.minimum(1, wan), np.maximum(1, wan)]) * wan
+    ok = np.zeros((len(wan), len(ns)), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for j, n in enumerate(ns.tolist()):
+            coefs = get_bessel_coefs(n)[0]
+            mod = 20 * np.log10(coefs[-1] / np.abs(np.polyval(coefs, 1j * w)))
+            ok[:, j] = (np.around(mod[0]) >= -Ap) & (np.around(mod[1]) <= -Aa)
+    return ok
+
+
+# bessel_delay_check: Retardo en wpn contra el retardo en wpn/10, con bessel_delay
+def bessel_delay_check(ns, wpn, tol):
+    ok = np.zeros((len(wpn), len(ns)), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for j, n in enumerate(ns.tolist()):
+            gd = bessel_delay(n, np.concatenate([wpn / 10, wpn])).reshape(2, -1)
+            ok[:, j] = gd[1] >= (1 - tol) * gd[0]
+    return ok
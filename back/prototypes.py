@@ -0,0 +1,148 @@
+import os
+import ast
+import hashlib
+import logging
+import numpy as np
+from back.cache import LRUCache
+
+# Biblioteca de prototipos normalizados precalculados (la arma back/build_prototypes.py).
+# Es un único .npy con un registro de tipo prototype_dtype por (aproximación, orden, parámetros), que se mapea en
+# memoria la primera vez que se lo necesita. Los ceros y los polos van seguidos en el mismo campo roots, que alcanza
+# para los 2n polos de Legendre y para los n ceros y n polos de Cauer.
+# Los parámetros de cada aproximación (ver Filter.get_params) son:
+# - Butterworth, Legendre: (Ap, 0)
+# - Cheby I: (rp, 0)
+# - Cheby II: (0, Aa)
+# - Cauer: (Ap, Aa)
+# - Bessel (normalizado en retardo) y Gauss: (0, 0)
+# Junto a la tabla se guarda (en <archivo>.hash) el hash del código con el que se la armó (ver get_source_hash); si no
+# coincide con el del código actual la tabla quedó vieja y no se la usa.
+# Si el archivo no existe o los parámetros no están en la grilla, lookup devuelve None y se calcula el prototipo.
+# Además, get guarda en memo (compartida por todo el proceso) cada prototipo que se usa, salga de la biblioteca o se
+# calcule, así que diseñar varios filtros parecidos o reintentar con otro orden no vuelve a calcular nada.
+
+NMAX = 40                                                   # Orden máximo tabulado
+AP_GRID = [0.1, 0.25, 0.5, 1, 1.5, 2, 3]                    # Grilla de Ap (y de rp) [dB]
+AA_GRID = [20, 25, 30, 35, 40, 45, 50, 60, 70, 80]          # Grilla de Aa [dB]
+
+prototype_dtype = np.dtype([("approx", "i1"), ("n", "i2"), ("p1", "f8"), ("p2", "f8"), ("nz", "i2"), ("np", "i2"),
+                            ("k", "f8"), ("roots", "c16", (2 * NMAX,))])
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prototypes.npy")
+
+# Métodos de Filter (back/FilterClass.py) con los que se calculan los prototipos
+filter_methods = ["get_fun", "get_wstop", "get_normalized_fun", "get_eps"]
+
+logger = logging.getLogger(__name__)
+
+table = None    # Arreglo mapeado en memoria (None si todavía no se cargó)
+index = None    # (aproximación, orden, p1, p2) -> fila de la tabla
+memo = LRUCache(maxsize=1024)   # (aproximación, orden, p1, p2) -> (z, p, k) ya usados, con arreglos de sólo lectura
+source_hash = None  # Hash del código que calcula los prototipos (se calcula la primera vez que hace falta)
+
+
+# get_key: Clave de búsqueda (los parámetros se redondean para que 0.1 calculado de distintas formas coincida)
+def get_key(approx, n, p1, p2):
+    return int(approx), int(n), round(float(p1), 9), round(float(p2), 9)
+
+
+# get_source_hash: Hash del código que calcula los prototipos: todas las aproximaciones de back/Approx y los métodos
+# filter_methods de Filter. Los métodos se buscan con ast en vez de importar FilterClass, que importa este módulo.
+def get_source_hash():
+    global source_hash
+    if source_hash is None:
+        back = os.path.dirname(os.path.abspath(__file__))
+        approx = os.path.join(back, "Approx")
+        h = hashlib.sha1()
+        for name in sorted([f for f in os.listdir(approx) if f.endswith(".py")]):
+            with open(os.path.join(approx, name), "rb") as f:
+                h.update(f.read())
+        with open(os.path.join(back, "FilterClass.py"), encoding="utf-8") as f:
+            source = f.read()
+        for node in ast.parse(source).body:
+            if isinstance(node, ast.ClassDef) and node.name == "Filter":
+                for method in node.body:
+                    if isinstance(method, ast.FunctionDef) and method.name in filter_methods:
+                        h.update(ast.get_source_segment(source, method).encode())
+        source_hash = h.hexdigest()[:16]
+    return source_hash
+
+
+# get_hash: Hash guardado junto a la tabla de path (None si no lo tiene)
+def get_hash(path=default_path):
+    try:
+        with open(path + ".hash") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# load: Mapea la tabla en memoria y arma el índice. Si el archivo no está o se armó con otro código (ver
+# get_source_hash), la biblioteca queda vacía.
+def load(path=default_path):
+    global table, index
+    stale = os.path.exists(path) and get_hash(path) != get_source_hash()
+    if stale:
+        logger.warning("La biblioteca de prototipos %s se armó con otro código y no se la usa (volver a armarla con "
+                       "python -m back.build_prototypes)", path)
+    if os.path.exists(path) and not stale:
+        table = np.load(path, mmap_mode="r")
+        keys = zip(table["approx"].tolist(), table["n"].tolist(), table["p1"].tolist(), table["p2"].tolist())
+        index = {get_key(*key): i for i, key in enumerate(keys)}
+    else:
+        table = np.zeros(0, dtype=prototype_dtype)
+        index = {}
+    return len(table)
+
+
+# lookup: Devuelve (z, p, k) del prototipo tabulado, o None si no está
+def lookup(approx, n, p1, p2):
+    if index is None:
+        load()
+    i = index.get(get_key(approx, n, p1, p2))
+    if i is None:
+        return None
+    row = table[i]
+    nz, np_ = row["nz"], row["np"]
+    return np.array(row["roots"][:nz]), np.array(row["roots"][nz:nz + np_]), float(row["k"])
+
+
+# get: Devuelve (z, p, k) del prototipo, de memo, de la biblioteca o, si no está en ninguna, calculándolo con
+# compute() (que debe devolverlo con la misma normalización que la biblioteca). Los arreglos son de sólo lectura,
+# porque se comparten entre todos los filtros que usan el mismo prototipo.
+def get(approx, n, p1, p2, compute):
+    key = get_key(approx, n, p1, p2)
+    proto = memo.get(key)
+    if proto is None:
+        proto = lookup(approx, n, p1, p2)
+        if proto is None:
+            proto = compute()
+        z, p, k = proto
+        z = np.array(z, dtype=complex).reshape(-1)
+        p = np.array(p, dtype=complex).reshape(-1)
+        z.setflags(write=False)
+        p.setflags(write=False)
+        proto = z, p, float(np.real(k))
+        memo.put(key, proto)
+    return proto
+
+
+# get_memo_stats: Aciertos, fallos y tamaño de memo
+def get_memo_stats():
+    return memo.stats()
+
+
+# save: Escribe los prototipos (lista de (aproximación, orden, p1, p2, z, p, k)) en path, con el hash del código actual
+def save(path, prototypes):
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=prototype_dtype, shape=(len(prototypes),))
+    for i, (approx, n, p1, p2, z, p, k) in enumerate(prototypes):
+        z = np.atleast_1d(np.asarray(z, dtype=complex))
+        p = np.atleast_1d(np.asarray(p, dtype=complex))
+        out[i]["approx"], out[i]["n"], out[i]["p1"], out[i]["p2"] = approx, n, p1, p2
+        out[i]["nz"], out[i]["np"], out[i]["k"] = len(z), len(p), k
+        out[i]["roots"][:len(z) + len(p)] = np.concatenate([z, p])
+    out.flush()
+    del out
+    with open(path + ".hash", "w") as f:
+        f.write(get_source_hash() + "\n")
+    return
@@ -0,0 +1,87 @@
+import numpy as np
+from copy import copy
+from collections import namedtuple
+from back.FilterClass import FilterType, ApproxType
+from back.backend import FilterSpace, design_filter
+from back.response import zpk_mod, group_delay
+from back.orders import get_orders
+from back.sweep import get_passband
+
+# Elección de la aproximación para una plantilla: se diseñan todas las aproximaciones, cada una con su orden mínimo
+# (el de back/orders.py) y los extra - 1 siguientes, se descartan los diseños que no cumplen la plantilla (get_orders
+# devuelve nmax cuando ningún orden cumple) y se devuelven los que quedan en el frente de Pareto de orden,
+# Q máximo de los polos (el de check_Q) y variación del retardo de grupo en la banda de paso (ver back/sweep.py).
+# Los diseños se reparten en un pool de hilos: todos usan la misma memoria de prototipos (back/prototypes.py), así que
+# los prototipos que comparten no se calculan dos veces.
+
+# Candidato de la recomendación:
+# - approx, n: Aproximación y orden
+# - Q: Q máximo de los polos
+# - gd_var: Variación relativa del retardo de grupo en la banda de paso
+# - filter: Filtro diseñado (sin agregar a ningún FilterSpace)
+Candidate = namedtuple("Candidate", ["approx", "n", "Q", "gd_var", "filter"])
+
+# Resultado de recommend:
+# - front: Candidatos del frente de Pareto, ordenados por orden y Q
+# - candidates: Todos los candidatos diseñados que cumplen la plantilla
+# - message: Mensaje de error de check_filter ("" si la plantilla es válida)
+Recommendation = namedtuple("Recommendation", ["front", "candidates", "message"])
+
+
+# recommend: Recibe la plantilla como addFilter (frecuencias en rad/s, des en %), las aproximaciones a comparar
+# (por defecto todas, o Bessel y Gauss para retardo de grupo) y cuántos órdenes probar de cada una.
+# Si se pasa un pool de hilos (concurrent.futures) los filtros se diseñan a la vez. Devuelve un Recommendation.
+def recommend(filter_type, wp, wa, Ap, Aa, des=0, approxs=None, nmin=1, nmax=25, extra=3, GD=None, tol=None, pool=None):
+    m = FilterSpace.check_filter(filter_type, None, wp, wa, Ap, Aa)
+    if m != "":
+        return Recommendation([], [], m)
+    if approxs is None:
+        approxs = [ApproxType.B, ApproxType.G] if filter_type == FilterType.GD else list(ApproxType)
+
+    # get_orders trabaja con arreglos de plantillas (tol como fracción, igual que Filter)
+    w = lambda x: np.array([x], dtype=float)
+    specs = []
+    for approx in approxs:
+        n0 = int(get_orders(approx, filter_type, w(wp), w(wa), Ap, Aa, nmin, nmax, GD, None if tol is None else tol / 100)[0])
+        if n0 > 0:
+            ns = [n for n in range(n0, n0 + extra) if n <= nmax] or [n0]
+            specs = specs + [(filter_type, approx, copy(wp), copy(wa), Ap, Aa, des, 1, n, None, None, None, None, None, GD, tol)
+                             for n in ns]
+
+    rs = list(pool.map(design_filter, specs)) if pool is not None else [design_filter(spec) for spec in specs]
+    candidates = []
+    for f, m in rs:
+        if f is None or f.type == FilterType.ERR or not meets_template(f):
+            continue
+        gd = group_delay(f.zeros, f.poles, get_passband(filter_type, f.data.wp))
+        candidates.append(Candidate(f.approx, f.data.n, f.data.Q, (gd.max() - gd.min()) / gd.max(), f))
+
+    if len(candidates) == 0:
+        return Recommendation([], [], "")
+    front = [candidates[i] for i in np.flatnonzero(get_pareto([(c.n, c.Q, c.gd_var) for c in candidates]))]
+    front.sort(key=lambda c: (c.n, c.Q))
+    return Recommendation(front, candidates, "")
+
+
+# meets_template: Si el filtro diseñado cumple la plantilla. La atenuación en los bordes de la banda de paso no puede
+# superar Ap y en los de la banda de atenuación tiene que llegar a Aa (redondeadas al dB, como los chequeos de
+# get_best_n); en retardo de grupo, el retardo del prototipo en wpn no puede caer más que tol respecto del de wpn/10.
+def meets_template(f):
+    if f.type == FilterType.GD:
+        wpn = f.get_wan()
+        tol = 0.1 if f.data.tol is None else f.data.tol
+        z, p, k = f.get_prototype(f.data.n)
+        gd = group_delay(z, p, [wpn / 10, wpn])
+        return bool(gd[1] >= (1 - tol) * gd[0])
+    A = lambda w: 20 * np.log10(f.data.G) - zpk_mod(f.zeros, f.poles, f.data.g, np.atleast_1d(w) / (2 * np.pi))
+    with np.errstate(invalid="ignore"):
+        return bool(np.all(np.around(A(f.data.wp)) <= f.data.Ap) and np.all(np.around(A(f.data.wa)) >= f.data.Aa))
+
+
+# get_pareto: Máscara de los puntos (filas de objetivos a minimizar) que ningún otro domina, es decir, que no hay
+# otro que sea igual o mejor en todos los objetivos y estrictamente mejor en alguno
+def get_pareto(points):
+    points = np.array(points, dtype=float).reshape(len(points), -1)
+    le = np.all(points[:, np.newaxis, :] <= points[np.newaxis, :, :], axis=2)    # le[j, i]: j igual o mejor que i
+    lt = np.any(points[:, np.newaxis, :] < points[np.newaxis, :, :], axis=2)     # lt[j, i]: j mejor que i en algo
+    return ~np.any(le & lt, axis=0)
@@ -0,0 +1,233 @@
+import numpy as np
+import scipy.signal as ss
+
+# zpk_response: Evalúa H(jw) directamente a partir de los ceros, polos y ganancia, sin pasar por num/den.
+# Cada factor (jw - z) o (jw - p) se aplica sobre todo el arreglo de w de una vez, alternando ceros y polos para que
+# el producto no desborde en órdenes altos (cosa que sí pasa al evaluar los polinomios de num/den).
+# El retardo de grupo sale en la misma pasada con group_delay.
+# Recibe: - z, p, k: ceros, polos y ganancia
+#         - w: arreglo de frecuencias (mismas unidades que los polos)
+# Devuelve: w, módulo [dB], fase [°] (desenrollada, como ss.bode) y retardo de grupo (-dφ/dw)
+def zpk_response(z, p, k, w):
+    w = np.atleast_1d(np.asarray(w, dtype=float))
+    z = np.atleast_1d(np.asarray(z, dtype=complex))
+    p = np.atleast_1d(np.asarray(p, dtype=complex))
+    s = 1j * w
+
+    h = np.full(len(w), k, dtype=complex)
+    for i in range(max(len(z), len(p))):
+        if i < len(z): h *= s - z[i]
+        if i < len(p): h /= s - p[i]
+
+    with np.errstate(divide="ignore"):
+        mod = 20 * np.log10(np.abs(h))
+    ph = np.degrees(np.unwrap(np.angle(h)))
+
+    gd = group_delay(z, p, w)
+
+    return w, mod, ph, gd
+
+
+# zpk_mod: Módulo [dB] de H(jw) para unos pocos puntos (por ejemplo, dentro de un buscador de raíces), sin calcular
+# la fase ni el retardo de grupo
+def zpk_mod(z, p, k, w):
+    s = 1j * np.atleast_1d(np.asarray(w, dtype=float))[:, np.newaxis]
+    h = k * np.prod(s - np.asarray(z, dtype=complex), axis=1) / np.prod(s - np.asarray(p, dtype=complex), axis=1)
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(np.abs(h))
+
+
+# group_delay: Retardo de grupo analítico, sin derivar la fase muestreada.
+# Cada polo aporta -Re(p)/|jw - p|^2 y cada cero lo mismo con signo opuesto (los ceros sobre el eje jw no aportan),
+# así que no depende de la densidad de la grilla ni se rompe con los saltos de fase.
+# Recibe: - z, p: ceros y polos
+#         - w: arreglo de frecuencias (mismas unidades que los polos)
+# Devuelve el retardo de grupo (-dφ/dw) en cada w
+def group_delay(z, p, w):
+    w = np.atleast_1d(np.asarray(w, dtype=float))
+    z = np.atleast_1d(np.asarray(z, dtype=complex))
+    p = np.atleast_1d(np.asarray(p, dtype=complex))
+    gd = np.zeros(len(w))
+    t = np.empty(len(w))
+    for root, sign in [(r, 1) for r in p] + [(r, -1) for r in z if r.real != 0]:
+        np.subtract(w, root.imag, out=t)
+        t *= t
+        t += root.real ** 2
+        np.divide(-sign * root.real, t, out=t)
+        gd += t
+    return gd
+
+
+# pack_roots: Acomoda las raíces de varios filtros en un arreglo 2-D de N filtros x (máxima cantidad de raíces),
+# completando los lugares sobrantes con 0 y devolviendo la máscara de los lugares ocupados.
+def pack_roots(roots):
+    roots = [np.atleast_1d(np.asarray(r, dtype=complex)) for r in roots]
+    size = max([len(r) for r in roots] + [0])
+    packed = np.zeros((len(roots), size), dtype=complex)
+    mask = np.zeros((len(roots), size), dtype=bool)
+    for i, r in enumerate(roots):
+        packed[i, :len(r)] = r
+        mask[i, :len(r)] = True
+    return packed, mask
+
+
+# batch_response: Igual que zpk_response pero para N filtros a la vez sobre el mismo arreglo de w.
+# Las raíces se empaquetan con pack_roots y cada lugar se aplica a la matriz de N filtros x M frecuencias de una vez;
+# en los lugares vacíos el factor se reemplaza por 1 (y no aportan al retardo de grupo).
+# Los filtros se ordenan por orden y se procesan en bloques de a lo sumo block elementos (filtros x frecuencias),
+# así se rellena lo menos posible y las matrices intermedias entran en la caché del procesador.
+# Recibe: - zs, ps, ks: listas de ceros, polos y ganancias de cada filtro
+#         - w: arreglo de frecuencias
+# Devuelve: w y matrices de N x M con el módulo [dB], la fase [°] y el retardo de grupo
+def batch_response(zs, ps, ks, w, block=1 << 14):
+    w = np.atleast_1d(np.asarray(w, dtype=float))
+    mod = np.empty((len(zs), len(w)))
+    ph = np.empty((len(zs), len(w)))
+    gd = np.empty((len(zs), len(w)))
+    for ixs in get_blocks(zs, ps, len(w), block):
+        z, zmask = pack_roots([zs[i] for i in ixs])
+        p, pmask = pack_roots([ps[i] for i in ixs])
+        s = 1j * w[np.newaxis, :]
+
+        h = np.repeat(np.asarray([ks[i] for i in ixs], dtype=complex)[:, np.newaxis], len(w), axis=1)
+        for i in range(max(z.shape[1], p.shape[1])):
+            if i < z.shape[1]:
+                d = s - z[:, i:i + 1]
+                if not zmask[:, i].all(): d[~zmask[:, i]] = 1
+                h *= d
+            if i < p.shape[1]:
+                d = s - p[:, i:i + 1]
+                if not pmask[:, i].all(): d[~pmask[:, i]] = 1
+                h /= d
+
+        with np.errstate(divide="ignore"):
+            mod[ixs] = 20 * np.log10(np.abs(h))
+        ph[ixs] = np.degrees(np.unwrap(np.angle(h), axis=1))
+        gd[ixs] = packed_group_delay(z, zmask, p, pmask, w)
+
+    return w, mod, ph, gd
+
+
+# batch_group_delay: Igual que group_delay pero para N filtros a la vez. Devuelve una matriz de N x M.
+def batch_group_delay(zs, ps, w, block=1 << 14):
+    w = np.atleast_1d(np.asarray(w, dtype=float))
+    gd = np.empty((len(zs), len(w)))
+    for ixs in get_blocks(zs, ps, len(w), block):
+        z, zmask = pack_roots([zs[i] for i in ixs])
+        p, pmask = pack_roots([ps[i] for i in ixs])
+        gd[ixs] = packed_group_delay(z, zmask, p, pmask, w)
+    return gd
+
+
+# packed_group_delay: Retardo de grupo de raíces ya empaquetadas con pack_roots
+def packed_group_delay(z, zmask, p, pmask, w):
+    gd = np.zeros((z.shape[0], len(w)))
+    t = np.empty((z.shape[0], len(w)))
+    for roots, mask, sign in [(p, pmask, 1), (z, zmask & (z.real != 0), -1)]:
+        for i in range(roots.shape[1]):
+            if not mask[:, i].any():
+                continue
+            r = roots[:, i:i + 1]
+            np.subtract(w, r.imag, out=t)
+            t *= t
+            t += r.real ** 2
+            t[~mask[:, i]] = 1
+            np.divide(-sign * r.real * mask[:, i:i + 1], t, out=t)
+            gd += t
+    return gd
+
+
+# get_blocks: Separa los índices de los filtros en bloques de órdenes parecidos de a lo sumo block elementos
+def get_blocks(zs, ps, m, block):
+    order = sorted(range(len(zs)), key=lambda i: max(len(np.atleast_1d(zs[i])), len(np.atleast_1d(ps[i]))))
+    size = max(1, block // max(m, 1))
+    return [order[i:i + size] for i in range(0, len(order), size)]
+
+
+# sos_response: Evalúa la transferencia analógica sección por sección a partir de la matriz SOS
+# (filas [b0, b1, b2, a0, a1, a2] con potencias descendentes de s, como las de ss.zpk2sos con analog=True).
+# Cada sección es a lo sumo de orden 2, así que no se pierde precisión en órdenes altos y el costo es lineal en el orden.
+# Devuelve: w, módulo [dB], fase [°] y retardo de grupo, igual que zpk_response
+def sos_response(sos, w):
+    w = np.atleast_1d(np.asarray(w, dtype=float))
+    w2 = w * w
+    h = np.ones(len(w), dtype=complex)
+    gd = np.zeros(len(w))
+    for b0, b1, b2, a0, a1, a2 in np.atleast_2d(sos):
+        num = (b2 - b0 * w2) + 1j * b1 * w
+        den = (a2 - a0 * w2) + 1j * a1 * w
+        h *= num / den
+        # -d(arg H)/dw = Im(D'/D) - Im(N'/N), con N' y D' las derivadas respecto de w
+        gd += np.imag((-2 * a0 * w + 1j * a1) / den)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gdn = np.imag((-2 * b0 * w + 1j * b1) / num)
+        gd -= np.where(num != 0, gdn, 0)
+
+    with np.errstate(divide="ignore"):
+        mod = 20 * np.log10(np.abs(h))
+    ph = np.degrees(np.unwrap(np.angle(h)))
+
+    return w, mod, ph, gd
+
+
+# sos_lsim: Simula la respuesta temporal a la entrada u pasando la señal por cada sección de la matriz SOS en cascada
+def sos_lsim(sos, u, t):
+    y = np.asarray(u, dtype=float)
+    for section in np.atleast_2d(sos):
+        num = np.trim_zeros(section[:3], "f")
+        den = np.trim_zeros(section[3:], "f")
+        if len(num) == 0:
+            return np.zeros(len(t))
+        t, y, x = ss.lsim((num, den), y, t)
+    return y
+
+
+# tf_to_sos: Arma la matriz SOS a partir de secciones (num, den) de orden a lo sumo 2
+def tf_to_sos(nums, dens):
+    sos = np.zeros((len(nums), 6))
+    for i in range(len(nums)):
+        sos[i, 3 - len(nums[i]):3] = nums[i]
+        sos[i, 6 - len(dens[i]):] = dens[i]
+    return sos
+
+
+# Campos de cada punto en los archivos exportados con export_response
+response_dtype = np.dtype([("w", "f8"), ("mod", "f8"), ("ph", "f8"), ("gd", "f8")])
+
+
+# iter_response: Genera la respuesta en frecuencia de a bloques de a lo sumo chunk puntos, para barridos que no entran
+# en memoria. Los puntos de cada bloque se calculan sobre la marcha y la fase se empalma con la del bloque anterior,
+# así que concatenar los bloques da lo mismo que evaluar zpk_response sobre la grilla completa.
+# Recibe: - z, p, k: ceros, polos y ganancia
+#         - wmin, wmax, num: rango de frecuencias y cantidad total de puntos
+#         - chunk: puntos por bloque
+#         - scale: "log" o "lin"
+# Genera: w, módulo [dB], fase [°] y retardo de grupo de cada bloque
+def iter_response(z, p, k, wmin, wmax, num, chunk=65536, scale="log"):
+    last = None
+    for start in range(0, num, chunk):
+        x = np.arange(start, min(start + chunk, num)) / max(num - 1, 1)
+        if scale == "lin":
+            w = wmin + (wmax - wmin) * x
+        else:
+            w = wmin * (wmax / wmin) ** x
+        w, mod, ph, gd = zpk_response(z, p, k, w)
+        if last is not None:
+            ph = ph - 360 * np.round((ph[0] - last) / 360)
+        last = ph[-1]
+        yield w, mod, ph, gd
+
+
+# export_response: Escribe la respuesta de iter_response directamente en un archivo .npy mapeado en memoria,
+# con un registro de tipo response_dtype por punto. La memoria usada no depende de num sino de chunk.
+# Devuelve el arreglo mapeado (de sólo lectura)
+def export_response(path, z, p, k, wmin, wmax, num, chunk=65536, scale="log"):
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=response_dtype, shape=(num,))
+    start = 0
+    for w, mod, ph, gd in iter_response(z, p, k, wmin, wmax, num, chunk, scale):
+        block = out[start:start + len(w)]
+        block["w"], block["mod"], block["ph"], block["gd"] = w, mod, ph, gd
+        start = start + len(w)
+    out.flush()
+    del out
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,184 @@
+import os
+import json
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from back.FilterClass import FilterType, ApproxType
+from back.backend import design_filter
+from back.response import group_delay
+
+# Barrido del espacio de diseño: diseña un filtro por cada combinación (producto cartesiano) de aproximación, Ap, Aa,
+# relación wa/wp (ratio) y factor de desnormalización (des), y guarda de cada uno el orden, el Q máximo y el retardo
+# de grupo que se obtuvo.
+# Los resultados se van agregando a un .csv (una fila por punto, en el orden del barrido) a medida que terminan los
+# bloques de block puntos, así que si el barrido se interrumpe, volver a llamar a run con el mismo archivo sigue desde
+# el primer punto que falta. load lo lee como arreglo estructurado y save_npz lo guarda por columnas en un .npz.
+# La primera línea del .csv es un comentario con la configuración que no va en las columnas (ver get_settings) y la
+# segunda el encabezado; al seguir un barrido se verifica que coincidan la configuración y los puntos ya guardados.
+#
+# ratio es la relación entre las bandas de la plantilla normalizada (la wan de Filter.get_wan): wa = ratio * wp en
+# pasa bajos, wa = wp / ratio en pasa altos y, en pasa banda y rechaza banda, el ancho de la banda ancha es ratio veces
+# el de la angosta, con las dos bandas centradas (geométricamente) en la misma frecuencia.
+#
+# Columnas:
+# - approx, Ap, Aa, ratio, des: Parámetros del punto
+# - ok: Si se pudo crear el filtro (si no, el resto de las columnas valen -1 o nan)
+# - n: Orden del filtro
+# - Q: Q máximo de los polos
+# - gd: Retardo de grupo al comienzo de la banda de paso [s]
+# - gd_var: Variación relativa del retardo de grupo ((máximo - mínimo) / máximo) en la década de la banda de paso que
+#   llega hasta el borde (en pasa banda, en toda la banda de paso)
+
+sweep_dtype = np.dtype([("approx", "i1"), ("Ap", "f8"), ("Aa", "f8"), ("ratio", "f8"), ("des", "f8"), ("ok", "?"),
+                        ("n", "i4"), ("Q", "f8"), ("gd", "f8"), ("gd_var", "f8")])
+sweep_formats = ["%d", "%.10g", "%.10g", "%.10g", "%.10g", "%d", "%d", "%.10g", "%.10g", "%.10g"]
+
+
+# get_points: Producto cartesiano de los parámetros, en el orden en que se barren (la aproximación es la más lenta)
+def get_points(approxs, Ap, Aa, ratio, des):
+    points = list(itertools.product([int(a) for a in approxs], Ap, Aa, ratio, des))
+    return np.array(points, dtype=sweep_dtype[["approx", "Ap", "Aa", "ratio", "des"]])
+
+
+# get_template: Frecuencias de paso y de atenuación [rad/s] de la plantilla con relación ratio, a partir de wp
+def get_template(filter_type, wp, ratio):
+    if filter_type == FilterType.LP:
+        return wp, wp * ratio
+    elif filter_type == FilterType.HP:
+        return wp, wp / ratio
+    elif filter_type in [FilterType.BP, FilterType.BR]:
+        # Banda angosta [wp, 2wp] y banda ancha de ancho ratio * wp con el mismo centro geométrico
+        wo2 = 2 * wp ** 2
+        b = ratio * wp
+        w1 = (b + np.sqrt(b ** 2 + 4 * wo2)) / 2
+        narrow, wide = [wp, 2 * wp], [wo2 / w1, w1]
+        return (narrow, wide) if filter_type == FilterType.BP else (wide, narrow)
+    return wp, None
+
+
+# get_passband: Frecuencias [Hz] de la banda de paso en las que se mide el retardo de grupo
+def get_passband(filter_type, wp):
+    fp = np.array(wp) / (2 * np.pi)
+    if filter_type in [FilterType.LP, FilterType.GD]:
+        return np.geomspace(fp / 10, fp, 16)
+    elif filter_type == FilterType.HP:
+        return np.geomspace(fp, fp * 10, 16)
+    elif filter_type == FilterType.BP:
+        return np.linspace(fp[0], fp[1], 16)
+    return np.concatenate([np.geomspace(fp[0] / 10, fp[0], 8), np.geomspace(fp[1], fp[1] * 10, 8)])
+
+
+# evaluate: Diseña el filtro de un punto del barrido y devuelve su fila. Recibe una tupla
+# (filter_type, approx, Ap, Aa, ratio, des, wp, nmin, nmax, Qmax, GD, tol), para poder mandarla a otros procesos.
+def evaluate(args):
+    filter_type, approx, Ap, Aa, ratio, des, wp, nmin, nmax, Qmax, GD, tol = args
+    row = (approx, Ap, Aa, ratio, des, False, -1, np.nan, np.nan, np.nan)
+    wp, wa = get_template(filter_type, wp, ratio)
+    try:
+        f, m = design_filter((filter_type, approx, wp, wa, Ap, Aa, des, 1, None, None, nmin, nmax, Qmax, None, GD, tol))
+    except Exception:
+        return row
+    if f is None or f.type == FilterType.ERR or len(f.poles) == 0:
+        return row
+    gd = group_delay(f.zeros, f.poles, get_passband(filter_type, f.data.wp)) / (2 * np.pi)
+    return approx, Ap, Aa, ratio, des, True, f.data.n, f.get_Q(f.poles), gd[0], (gd.max() - gd.min()) / gd.max()
+
+
+# run: Barre el producto cartesiano de approxs, Ap, Aa, ratio y des para el tipo de filtro filter_type y agrega los
+# resultados a path (.csv). Los puntos se reparten entre processes procesos (por defecto uno por núcleo).
+# Si path ya tiene resultados (de un barrido interrumpido con los mismos parámetros), sólo se calculan los que faltan;
+# si esos resultados son de otra configuración o de otros puntos, se lanza ValueError.
+# Devuelve la tabla completa (ver load).
+def run(path, filter_type=FilterType.LP, approxs=None, Ap=(1,), Aa=(40,), ratio=(2,), des=(0,), wp=2 * np.pi * 1000,
+        nmin=1, nmax=25, Qmax=None, GD=None, tol=None, processes=None, block=1024):
+    if approxs is None:
+        approxs = [ApproxType.B, ApproxType.G] if filter_type == FilterType.GD else list(ApproxType)
+    points = get_points(approxs, Ap, Aa, ratio, des)
+    settings = get_settings(filter_type, wp, nmin, nmax, Qmax, GD, tol)
+    done = get_done(path, settings)
+    if load_settings(path) != settings:
+        raise ValueError("El archivo " + path + " tiene resultados de un barrido con otra configuración")
+    if done > len(points):
+        raise ValueError("El archivo " + path + " tiene más filas que puntos el barrido")
+    if done > 0 and not same_points(load(path)[:done], points[:done]):
+        raise ValueError("El archivo " + path + " tiene resultados de un barrido con otros parámetros")
+    processes = (os.cpu_count() or 1) if processes is None else processes
+    pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    try:
+        with open(path, "a") as out:
+            for start in range(done, len(points), block):
+                args = [(filter_type, int(p["approx"]), float(p["Ap"]), float(p["Aa"]), float(p["ratio"]),
+                         float(p["des"]), wp, nmin, nmax, Qmax, GD, tol) for p in points[start:start + block]]
+                if pool is None:
+                    rows = [evaluate(a) for a in args]
+                else:
+                    rows = list(pool.map(evaluate, args, chunksize=max(1, len(args) // (4 * processes))))
+                np.savetxt(out, np.array(rows, dtype=sweep_dtype), fmt=sweep_formats, delimiter=",")
+                out.flush()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return load(path)
+
+
+# get_settings: Configuración del barrido que no va en las columnas, como diccionario que se puede pasar a JSON
+def get_settings(filter_type, wp, nmin, nmax, Qmax, GD, tol):
+    number = lambda x, cast: None if x is None else cast(x)
+    settings = {"filter_type": int(filter_type), "wp": number(wp, float), "nmin": number(nmin, int),
+                "nmax": number(nmax, int), "Qmax": number(Qmax, float), "GD": number(GD, float), "tol": number(tol, float)}
+    return json.loads(json.dumps(settings))
+
+
+# load_settings: Configuración guardada en la primera línea de path (None si no la tiene)
+def load_settings(path):
+    with open(path) as f:
+        line = f.readline()
+    if not line.startswith("# "):
+        return None
+    try:
+        return json.loads(line[2:])
+    except ValueError:
+        return None
+
+
+# get_done: Cantidad de puntos ya guardados en path. Si no existe lo crea con la configuración settings y el
+# encabezado, y si la última fila quedó cortada (se interrumpió mientras se escribía) la descarta.
+def get_done(path, settings):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, "w") as out:
+            out.write("# " + json.dumps(settings) + "\n")
+            out.write(",".join(sweep_dtype.names) + "\n")
+        return 0
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        f.truncate(end)
+    return max(data[:end].count(b"\n") - 2, 0)
+
+
+# same_points: Si las columnas de parámetros de la tabla coinciden con las de points (los flotantes se guardan con 10
+# cifras significativas, así que se comparan con esa tolerancia)
+def same_points(table, points):
+    if len(table) != len(points) or np.any(table["approx"] != points["approx"]):
+        return False
+    return all([np.allclose(table[name], points[name], rtol=1E-9, atol=0) for name in ["Ap", "Aa", "ratio", "des"]])
+
+
+# load: Lee los resultados de un barrido (.csv) como arreglo estructurado de tipo sweep_dtype
+def load(path):
+    return np.loadtxt(path, delimiter=",", skiprows=2, dtype=sweep_dtype, ndmin=1)
+
+
+# save_npz: Guarda la tabla en un .npz con un arreglo por columna
+def save_npz(path, table):
+    np.savez(path, **{name: table[name] for name in table.dtype.names})
+    return
+
+
+# load_npz: Lee una tabla guardada con save_npz
+def load_npz(path):
+    with np.load(path) as data:
+        table = np.zeros(len(data[sweep_dtype.names[0]]), dtype=sweep_dtype)
+        for name in sweep_dtype.names:
+            table[name] = data[name]
+    return table